@@ -0,0 +1,148 @@
+import os
+import hashlib
+from instrumentation import log
+
+# Derived output files (pairs.txt, the TradingView watchlist, the active pairs lists, ...)
+# Every output format is an Artifact registered here; the scanner renders them from a QuoteView per quote currency
+# and hands the results to an ArtifactWriter, which only touches files whose content actually changed.
+#
+# Adding a format is one call, e.g. a CSV of traded pairs:
+#
+#     from artifacts import register_artifact
+#     register_artifact("traded_csv", lambda label: f"traded_{label}.csv",
+#                       lambda view: "pair\n" + "".join(pair + "\n" for pair in view.traded_pairs))
+
+# What an artifact is rendered from: one quote currency's pairs on one venue after a scan
+# traded_pairs and disabled_pairs are sorted lists of the venue's symbols (e.g. BTC-USD); products holds the raw
+# product records for the quote, and tradingview_prefix the exchange prefix TradingView uses for the venue
+class QuoteView:
+    def __init__(self, quote, traded_pairs, disabled_pairs, products, venue="coinbase", tradingview_prefix="COINBASE"):
+        self.quote = quote
+        self.traded_pairs = traded_pairs
+        self.disabled_pairs = disabled_pairs
+        self.products = products
+        self.venue = venue
+        self.tradingview_prefix = tradingview_prefix
+
+# One output format
+# filename(label) gives the file name for a quote currency's label (the quote itself on Coinbase Exchange,
+# e.g. BINANCE-USDT on other venues) and render(view) its full content.
+# By default an artifact is only re-rendered when the quote's traded/disabled pairs change; artifacts that also
+# show tracked fields (post_only, status, ...) set uses_statuses so they re-render on field changes too.
+class Artifact:
+    def __init__(self, name, filename, render, message=None, uses_statuses=False):
+        self.name = name
+        self.filename = filename
+        self.render = render
+        self.message = message
+        self.uses_statuses = uses_statuses
+
+# Registered artifacts by name, rendered in registration order
+ARTIFACTS = {}
+
+def register_artifact(name, filename, render, message=None, uses_statuses=False):
+    artifact = ARTIFACTS[name] = Artifact(name, filename, render, message, uses_statuses)
+    return artifact
+
+def unregister_artifact(name):
+    ARTIFACTS.pop(name, None)
+
+# Built-in formats
+# USD keeps the original file names; every other quote gets its own suffixed set of files
+def render_pairs(view):
+    content = "Traded Pairs:\n"
+    content += "".join(pair + "\n" for pair in view.traded_pairs)
+    content += "\nDisabled Pairs:\n"
+    content += "".join(pair + "\n" for pair in view.disabled_pairs)
+    return content
+
+def render_watchlist(view):
+    return "".join(f"{view.tradingview_prefix}:{pair.replace('-', '')},\n" for pair in view.traded_pairs)
+
+def render_active_pairs(view):
+    return "".join(pair + "\n" for pair in view.traded_pairs)
+
+def render_active_pairs_no_quote(view):
+    return "".join(pair + "\n" for pair in sorted(pair.replace(f'-{view.quote}', '') for pair in view.traded_pairs))
+
+register_artifact("pairs", lambda label: "pairs.txt" if label == 'USD' else f"pairs_{label}.txt", render_pairs)
+register_artifact("watchlist", lambda label: "TV-Coinbase-Watchlist.txt" if label == 'USD' else f"TV-Coinbase-Watchlist-{label}.txt",
+                  render_watchlist)
+register_artifact("active_pairs", lambda label: "active_pairs.txt" if label == 'USD' else f"active_pairs_{label}.txt",
+                  render_active_pairs, "{filename} has been updated with traded pairs sorted alphabetically.")
+register_artifact("active_pairs_no_quote", lambda label: f"active_pairs_no_{label.lower()}.txt", render_active_pairs_no_quote,
+                  "{filename} has been updated with traded pairs without the '-{quote}' suffix.")
+
+def content_hash(content):
+    return hashlib.blake2b(content.encode(), digest_size=16).digest()
+
+# Writes derived files only when their content changes
+# The hash of every file's current content is kept in memory (a file is read and hashed once, the first time it is
+# staged), so deciding whether to write never touches the disk. stage() only queues a change; commit() writes every
+# queued file to a temporary file, fsyncs them all, renames them over their targets and fsyncs each directory once,
+# so a scan's outputs are flushed together and readers only ever see complete old or new files.
+class ArtifactWriter:
+    def __init__(self):
+        self.hashes = {}
+        self.staged = {}
+
+    def known_hash(self, path):
+        if path not in self.hashes:
+            try:
+                with open(path, "r") as file:
+                    self.hashes[path] = content_hash(file.read())
+            except FileNotFoundError:
+                self.hashes[path] = None
+        return self.hashes[path]
+
+    # Queue content for path; returns True when it differs from what is on disk
+    def stage(self, path, content, message=None):
+        digest = content_hash(content)
+        if digest == self.known_hash(path):
+            self.staged.pop(path, None)
+            return False
+        self.staged[path] = (content, digest, message)
+        return True
+
+    # Write everything staged since the last commit; returns the paths that were written
+    # If a write fails (disk full, permissions, ...) the exception propagates and every file not yet in place stays
+    # staged, so the next commit tries it again instead of the content being lost
+    def commit(self):
+        if not self.staged:
+            return []
+        staged = dict(self.staged)
+        try:
+            for path, (content, digest, message) in staged.items():
+                with open(path + ".tmp", "w") as file:
+                    file.write(content)
+                    file.flush()
+                    os.fsync(file.fileno())
+            for path, (content, digest, message) in staged.items():
+                os.replace(path + ".tmp", path)
+                self.hashes[path] = digest
+                del self.staged[path]
+        except OSError:
+            for path in self.staged:
+                try:
+                    os.remove(path + ".tmp")
+                except OSError:
+                    pass
+            raise
+        for directory in {os.path.dirname(path) for path in staged}:
+            fsync_directory(directory)
+        for path, (content, digest, message) in staged.items():
+            log(message or f"{os.path.basename(path)} has been updated.")
+        return list(staged)
+
+# Make the renames durable; not every platform can open a directory, so this is best effort
+def fsync_directory(directory):
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
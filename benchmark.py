@@ -0,0 +1,519 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import contextlib
+import tracemalloc
+import http.server
+from datetime import datetime
+import requests
+from fetch_usd_pairs import PairScanner, PRODUCTS_URL
+from status_stream import StatusStream, STATUS_FEED_URL
+
+# Benchmark and replay harness for the scan pipeline
+# Everything runs against a local stand-in for /products, so no live exchange is needed:
+#   python benchmark.py synthetic --sizes 1000 10000 100000 --churn 0.001 --scans 50 [--save-baseline | --compare]
+#   python benchmark.py record --dir snapshots --duration 86400      record live /products payloads that changed
+#   python benchmark.py replay --dir snapshots [--update-expected]   replay them and check the notifications
+#   python benchmark.py stream-record --output status.jsonl --duration 3600    record the live WebSocket status channel
+#   python benchmark.py stream-replay --messages status.jsonl --products snapshots/1700000000000.json [--state DIR]
+#                                     [--update-expected]          replay them through a local WebSocket stand-in
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+BASELINE_PATH = os.path.join(script_dir, "benchmark_baseline.json")
+EXPECTED_NOTIFICATIONS = "expected_notifications.json"
+
+# Stages reported by PairScanner.stage_times, plus the whole scan
+STAGES = ("fetch", "decode", "filter", "diff", "render", "write", "notify", "total")
+
+# Local HTTP stand-in for the /products endpoint, serving whatever payload was set last
+# Requests wait while `ready` is cleared, to hold a REST scan back until a test lets it finish
+class PayloadServer:
+    def __init__(self):
+        self.payload = b"[]"
+        self.ready = threading.Event()
+        self.ready.set()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.ready.wait()
+                body = server.payload
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/products"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+# Synthetic /products payload with `count` products spread over a few quote currencies
+def synthetic_products(count, rng):
+    quotes = ["USD"] * 6 + ["USDC", "USDT", "EUR", "BTC"]
+    products = []
+    for i in range(count):
+        quote = rng.choice(quotes)
+        products.append({
+            "id": f"T{i:06d}-{quote}",
+            "base_currency": f"T{i:06d}",
+            "quote_currency": quote,
+            "post_only": False,
+            "limit_only": False,
+            "cancel_only": False,
+            "status": "online",
+            "status_message": "",
+            "trading_disabled": rng.random() < 0.1,
+            "auction_mode": False,
+        })
+    return products
+
+# Next payload: `churn` of the products get one field changed, and now and then a new product is listed
+def apply_churn(products, churn, rng):
+    products = [dict(product) for product in products]
+    for product in rng.sample(products, max(1, int(len(products) * churn))):
+        field = rng.choice(("post_only", "limit_only", "cancel_only", "trading_disabled", "auction_mode", "status", "status_message"))
+        if field == "status":
+            product[field] = "offline" if product[field] == "online" else "online"
+        elif field == "status_message":
+            product[field] = "" if product[field] else "Maintenance in progress"
+        else:
+            product[field] = not product[field]
+    if rng.random() < 0.1:
+        i = len(products)
+        products.append(dict(products[0], id=f"N{i:06d}-USD", base_currency=f"N{i:06d}", quote_currency="USD"))
+    return products
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+# Fresh scanner writing into a throwaway directory, with notifications collected instead of sent
+def make_scanner(directory, url, notifications):
+    return PairScanner(directory, url, notify=lambda content, quote: notifications.append((quote, content)), quote_currencies=None)
+
+def close_scanner(scanner):
+    scanner.events.close()
+    scanner.fetcher.close()
+
+# Serve each payload in turn and scan it, returning per-stage timings for every scan
+def run_scans(scanner, server, payloads):
+    timings = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for payload in payloads:
+            server.payload = payload
+            started = time.perf_counter()
+            scanner.scan()
+            stage_times = dict(scanner.stage_times)
+            stage_times["total"] = time.perf_counter() - started
+            timings.append(stage_times)
+    return timings
+
+def benchmark_size(server, count, churn, scans, seed):
+    rng = random.Random(seed)
+    products = synthetic_products(count, rng)
+    payloads = [json.dumps(products).encode()]
+    for _ in range(scans):
+        products = apply_churn(products, churn, rng)
+        payloads.append(json.dumps(products).encode())
+
+    directory = tempfile.mkdtemp(prefix="pair-scanner-bench-")
+    try:
+        # Timing pass: the first payload only builds the initial state and is not measured
+        notifications = []
+        scanner = make_scanner(directory, server.url, notifications)
+        run_scans(scanner, server, payloads[:1])
+        timings = run_scans(scanner, server, payloads[1:])
+        close_scanner(scanner)
+
+        # Memory pass, separate because tracemalloc slows everything down
+        shutil.rmtree(directory)
+        os.makedirs(directory)
+        tracemalloc.start()
+        scanner = make_scanner(directory, server.url, [])
+        run_scans(scanner, server, payloads[:1])
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        run_scans(scanner, server, payloads[1:])
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        close_scanner(scanner)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+    result = {"products": count, "churn": churn, "scans": scans, "notifications": len(notifications), "stages": {}}
+    for stage in STAGES:
+        values = [timing.get(stage, 0.0) * 1000 for timing in timings]
+        result["stages"][stage] = {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values),
+        }
+    result["peak_memory_mb"] = peak / 1024 / 1024
+    result["retained_allocations_kb"] = allocated / 1024
+    return result
+
+def print_result(result):
+    print(f"\n{result['products']} products, churn {result['churn']}, {result['scans']} scans, "
+          f"{result['notifications']} notifications, peak memory {result['peak_memory_mb']:.1f} MB, "
+          f"retained allocations {result['retained_allocations_kb']:.0f} KB")
+    print(f"{'stage':<8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage in STAGES:
+        row = result["stages"][stage]
+        print(f"{stage:<8} {row['p50']:>9.2f} {row['p95']:>9.2f} {row['p99']:>9.2f} {row['max']:>9.2f}")
+
+# Compare results against the saved baseline; a p50 or p95 that got slower than the tolerance allows is a regression
+def compare_to_baseline(results, baseline, tolerance):
+    regressions = []
+    previous = {(entry["products"], entry["churn"]): entry for entry in baseline.get("results", [])}
+    for result in results:
+        entry = previous.get((result["products"], result["churn"]))
+        if entry is None:
+            continue
+        for stage in STAGES:
+            # Baselines saved before a stage existed have nothing to compare against
+            if stage not in entry["stages"]:
+                continue
+            for stat in ("p50", "p95"):
+                old = entry["stages"][stage][stat]
+                new = result["stages"][stage][stat]
+                # Ignore sub-millisecond noise
+                if new > old * (1 + tolerance) and new - old > 0.5:
+                    regressions.append(f"{result['products']} products {stage} {stat}: {old:.2f} ms -> {new:.2f} ms")
+    return regressions
+
+def command_synthetic(args):
+    server = PayloadServer()
+    try:
+        results = []
+        for count in args.sizes:
+            result = benchmark_size(server, count, args.churn, args.scans, args.seed)
+            print_result(result)
+            results.append(result)
+    finally:
+        server.close()
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump({"created": datetime.now().isoformat(), "results": results}, file, indent=2)
+        print(f"\nBaseline saved to {args.baseline}.")
+    if args.compare:
+        try:
+            with open(args.baseline, "r") as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            print(f"\nNo baseline at {args.baseline}; run with --save-baseline first.")
+            return 1
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+# Poll the live endpoint and save every payload that differs from the previous one
+# Files are named by their millisecond timestamp so a replay runs them in the order they were seen
+def command_record(args):
+    os.makedirs(args.dir, exist_ok=True)
+    session = requests.Session()
+    last_hash = None
+    saved = 0
+    deadline = time.time() + args.duration
+    while time.time() < deadline:
+        started = time.time()
+        try:
+            response = session.get(args.url, timeout=10)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching {args.url}: {e}")
+        else:
+            payload_hash = hashlib.blake2b(response.content, digest_size=16).digest()
+            if payload_hash != last_hash:
+                with open(os.path.join(args.dir, f"{int(started * 1000)}.json"), "wb") as file:
+                    file.write(response.content)
+                last_hash = payload_hash
+                saved += 1
+                print(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - saved snapshot {saved}")
+        time.sleep(max(0.0, args.interval - (time.time() - started)))
+    return 0
+
+# Replay recorded snapshots through a fresh scanner and compare the notifications it emits
+# against the expected ones saved alongside the snapshots
+def command_replay(args):
+    snapshots = sorted(name for name in os.listdir(args.dir) if name.endswith(".json") and name != EXPECTED_NOTIFICATIONS)
+    if not snapshots:
+        print(f"No snapshots found in {args.dir}.")
+        return 1
+    payloads = []
+    for name in snapshots:
+        with open(os.path.join(args.dir, name), "rb") as file:
+            payloads.append(file.read())
+
+    server = PayloadServer()
+    directory = tempfile.mkdtemp(prefix="pair-scanner-replay-")
+    notifications = []
+    try:
+        scanner = make_scanner(directory, server.url, notifications)
+        emitted = []
+        timings = []
+        for name, payload in zip(snapshots, payloads):
+            count = len(notifications)
+            timings.extend(run_scans(scanner, server, [payload]))
+            emitted.extend({"snapshot": name, "quote": quote, "content": content} for quote, content in notifications[count:])
+        close_scanner(scanner)
+    finally:
+        server.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    totals = [timing["total"] * 1000 for timing in timings]
+    print(f"Replayed {len(snapshots)} snapshots: {len(emitted)} notifications, "
+          f"scan p50 {percentile(totals, 50):.2f} ms, p95 {percentile(totals, 95):.2f} ms")
+
+    expected_path = os.path.join(args.dir, EXPECTED_NOTIFICATIONS)
+    if args.update_expected:
+        with open(expected_path, "w") as file:
+            json.dump(emitted, file, indent=1)
+        print(f"Expected notifications saved to {expected_path}.")
+        return 0
+    try:
+        with open(expected_path, "r") as file:
+            expected = json.load(file)
+    except FileNotFoundError:
+        print(f"No {EXPECTED_NOTIFICATIONS} in {args.dir}; run with --update-expected to create it.")
+        return 1
+    if emitted == expected:
+        print("Notifications match the expected output.")
+        return 0
+    for index, (got, want) in enumerate(zip(emitted, expected)):
+        if got != want:
+            print(f"First difference at notification {index} (snapshot {want['snapshot']}):")
+            print(f"  expected: {want['content']!r}")
+            print(f"  got:      {got['content']!r}")
+            break
+    else:
+        print(f"Expected {len(expected)} notifications, got {len(emitted)}.")
+    return 1
+
+# Local stand-in for the WebSocket feed: accepts a subscription and sends each queued message in order
+class StatusFeedServer:
+    def __init__(self):
+        self.messages = asyncio.Queue()
+        self.server = None
+        self.url = None
+
+    async def start(self):
+        try:
+            from websockets.asyncio.server import serve
+        except ImportError:
+            raise RuntimeError("Stream replay requires the websockets package: pip install websockets")
+        self.server = await serve(self.handle, "127.0.0.1", 0)
+        self.url = f"ws://127.0.0.1:{next(iter(self.server.sockets)).getsockname()[1]}"
+
+    async def handle(self, ws):
+        await ws.recv()
+        while (message := await self.messages.get()) is not None:
+            await ws.send(message)
+
+    async def close(self):
+        await self.messages.put(None)
+        self.server.close()
+        await self.server.wait_closed()
+
+# Save every status channel message (heartbeats left out) as one line, for stream-replay
+async def record_stream(args):
+    import websockets
+    saved = 0
+    deadline = time.time() + args.duration
+    with open(args.output, "a") as file:
+        async with websockets.connect(args.url, max_size=None) as ws:
+            await ws.send(StatusStream(None, url=args.url).subscribe_message())
+            while time.time() < deadline:
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), max(0.0, deadline - time.time()))
+                except asyncio.TimeoutError:
+                    break
+                if '"heartbeat"' in raw[:40]:
+                    continue
+                file.write(raw.replace("\n", " ") + "\n")
+                file.flush()
+                saved += 1
+    print(f"Saved {saved} messages to {args.output}.")
+    return 0
+
+def command_stream_record(args):
+    return asyncio.run(record_stream(args))
+
+async def wait_until(condition, what, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out waiting for {what}.")
+        await asyncio.sleep(0.005)
+
+# Drive a StatusStream against the local stand-ins the way a restart plays out live: the first `rest_after`
+# messages arrive while the reconciliation scan's /products request is still in flight, then that scan completes,
+# then the remaining messages follow. Each message is sent once the previous one has been handled, so the
+# notifications are attributed to the step that produced them and the run is deterministic.
+async def replay_stream(messages, payload, directory, rest_after):
+    feed = StatusFeedServer()
+    await feed.start()
+    server = PayloadServer()
+    server.payload = payload
+    server.ready.clear()
+    notifications = []
+    scanner = make_scanner(directory, server.url, notifications)
+    stream = StatusStream(scanner, url=feed.url, reconcile_interval=3600.0)
+    task = asyncio.create_task(stream.run())
+    emitted = []
+
+    def collect(step, count):
+        emitted.extend({"step": step, "quote": quote, "content": content} for quote, content in notifications[count:])
+
+    async def finish_rest_scan():
+        count = len(notifications)
+        server.ready.set()
+        await wait_until(lambda: stream.reconcile_count >= 1, "the reconciliation scan")
+        collect("rest", count)
+
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for index, message in enumerate(messages):
+                if index == rest_after:
+                    await finish_rest_scan()
+                count = len(notifications)
+                await feed.messages.put(message)
+                await wait_until(lambda: stream.message_count >= index + 1, f"message {index + 1} to be handled")
+                collect(f"message {index + 1}", count)
+            if not server.ready.is_set():
+                await finish_rest_scan()
+    finally:
+        stream.stop()
+        server.ready.set()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await feed.close()
+        server.close()
+        close_scanner(scanner)
+    return emitted
+
+# Replay recorded status channel messages through a fresh scanner and compare the notifications it emits
+# against the expected ones; --state starts the scanner from saved files (pairs.txt, fields_status.txt, ...)
+# to replay a restart
+def command_stream_replay(args):
+    with open(args.messages, "r") as file:
+        messages = [line.strip() for line in file if line.strip()]
+    payload = b"[]"
+    if args.products:
+        with open(args.products, "rb") as file:
+            payload = file.read()
+
+    directory = tempfile.mkdtemp(prefix="pair-scanner-stream-")
+    try:
+        if args.state:
+            shutil.copytree(args.state, directory, dirs_exist_ok=True)
+        emitted = asyncio.run(replay_stream(messages, payload, directory, args.rest_after))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    print(f"Replayed {len(messages)} messages: {len(emitted)} notifications")
+
+    expected_path = args.expected or os.path.splitext(args.messages)[0] + ".expected.json"
+    if args.update_expected:
+        with open(expected_path, "w") as file:
+            json.dump(emitted, file, indent=1)
+        print(f"Expected notifications saved to {expected_path}.")
+        return 0
+    try:
+        with open(expected_path, "r") as file:
+            expected = json.load(file)
+    except FileNotFoundError:
+        print(f"No {expected_path}; run with --update-expected to create it.")
+        return 1
+    if emitted == expected:
+        print("Notifications match the expected output.")
+        return 0
+    for index, (got, want) in enumerate(zip(emitted, expected)):
+        if got != want:
+            print(f"First difference at notification {index} ({want['step']}):")
+            print(f"  expected: {want['content']!r}")
+            print(f"  got:      {got['content']!r}")
+            break
+    else:
+        print(f"Expected {len(expected)} notifications, got {len(emitted)}.")
+    return 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and replay harness for the pair scanner.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    synthetic = subparsers.add_parser("synthetic", help="benchmark against synthetic payloads")
+    synthetic.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    synthetic.add_argument("--churn", type=float, default=0.001, help="fraction of products changing per scan")
+    synthetic.add_argument("--scans", type=int, default=50)
+    synthetic.add_argument("--seed", type=int, default=1)
+    synthetic.add_argument("--baseline", default=BASELINE_PATH)
+    synthetic.add_argument("--save-baseline", action="store_true")
+    synthetic.add_argument("--compare", action="store_true", help="exit non-zero on regressions against the baseline")
+    synthetic.add_argument("--tolerance", type=float, default=0.2)
+
+    record = subparsers.add_parser("record", help="record live /products payloads")
+    record.add_argument("--dir", required=True)
+    record.add_argument("--url", default=PRODUCTS_URL)
+    record.add_argument("--interval", type=float, default=2.0)
+    record.add_argument("--duration", type=float, default=86400.0)
+
+    replay = subparsers.add_parser("replay", help="replay recorded payloads and check the notifications")
+    replay.add_argument("--dir", required=True)
+    replay.add_argument("--update-expected", action="store_true")
+
+    stream_record = subparsers.add_parser("stream-record", help="record live WebSocket status channel messages")
+    stream_record.add_argument("--output", required=True)
+    stream_record.add_argument("--url", default=STATUS_FEED_URL)
+    stream_record.add_argument("--duration", type=float, default=3600.0)
+
+    stream_replay = subparsers.add_parser("stream-replay", help="replay recorded status messages and check the notifications")
+    stream_replay.add_argument("--messages", required=True, help="file of recorded messages, one per line")
+    stream_replay.add_argument("--products", help="/products payload served to the reconciliation scan")
+    stream_replay.add_argument("--state", help="directory of saved state files to start from")
+    stream_replay.add_argument("--rest-after", type=int, default=1,
+                               help="messages that arrive before the first reconciliation scan completes")
+    stream_replay.add_argument("--expected", help="expected notifications (default <messages>.expected.json)")
+    stream_replay.add_argument("--update-expected", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command == "synthetic":
+        return command_synthetic(args)
+    if args.command == "record":
+        return command_record(args)
+    if args.command == "stream-record":
+        return command_stream_record(args)
+    if args.command == "stream-replay":
+        return command_stream_replay(args)
+    return command_replay(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import json
+import queue
+import threading
+import time
+import requests
+from file_utils import write_file_atomic
+from instrumentation import log, NOTIFICATIONS_SENT, NOTIFICATION_DELIVERY_SECONDS, RATE_LIMITED
+
+# Discord rejects message content longer than this many characters
+DISCORD_MESSAGE_LIMIT = 2000
+
+# Function to split content into chunks that fit within Discord's message limit
+# Chunks are broken on line boundaries so a pair and its link stay together, and a single
+# line that is longer than the limit on its own is hard-split
+def split_message(content, limit=DISCORD_MESSAGE_LIMIT):
+    chunks = []
+    current = ""
+    for line in content.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+# Background dispatcher for Discord webhook notifications
+# send() only puts the content on a bounded queue and returns immediately, so the scan loop never waits on Discord.
+# A single worker thread drains the queue, coalesces everything queued within the same window into one post,
+# splits it over Discord's 2000 character limit, and honours 429 retry_after responses.
+# Messages that have not been delivered yet are kept in pending_path so they survive a restart.
+class DiscordNotifier:
+    def __init__(self, webhook_url, pending_path, max_queue_size=1000, coalesce_window=1.0, timeout=10):
+        self.webhook_url = webhook_url
+        self.pending_path = pending_path
+        self.coalesce_window = coalesce_window
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.session = requests.Session()
+        self.stop_event = threading.Event()
+        self.worker = None
+
+        # Messages the worker has taken off the queue but not delivered yet
+        # The queue carries (content, queued_at) so delivery latency can be measured; pending keeps only the content
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self.oldest_queued_at = None
+
+        # Counters for delivered posts, rate limits hit and messages spilled because the queue was full
+        self.sent_count = 0
+        self.rate_limited_count = 0
+        self.overflow_count = 0
+
+        self.load_pending()
+
+    # Load undelivered messages left behind by a previous run; they are delivered before anything new
+    def load_pending(self):
+        try:
+            with open(self.pending_path, "r") as file:
+                self.pending = json.load(file)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            log(f"{self.pending_path} could not be read, discarding it.")
+            return
+        if self.pending:
+            log(f"Loaded {len(self.pending)} undelivered Discord notification(s).")
+
+    def save_pending(self):
+        with self.pending_lock:
+            content = json.dumps(self.pending)
+        write_file_atomic(self.pending_path, content)
+
+    def start(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.run, name="discord-notifier", daemon=True)
+            self.worker.start()
+
+    # Queue content for delivery without blocking
+    # When the queue is full the message is appended straight to the pending file instead of being dropped
+    def send(self, content):
+        if not content.strip():
+            return
+        try:
+            self.queue.put_nowait((content, time.monotonic()))
+        except queue.Full:
+            self.overflow_count += 1
+            with self.pending_lock:
+                self.pending.append(content)
+            self.save_pending()
+            log("Discord notification queue is full, message saved for later delivery.")
+
+    # Wait until everything queued so far has been delivered (or the timeout expires)
+    # Returns True when the queue and pending list are empty
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks or self.pending:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    # Stop the worker and persist anything that is still undelivered
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        if self.worker is not None:
+            self.worker.join(timeout)
+            self.worker = None
+        self.drain_queue()
+        if self.pending:
+            self.save_pending()
+            log(f"{len(self.pending)} undelivered Discord notification(s) saved to {self.pending_path}.")
+
+    # Move everything currently on the queue into the pending list
+    def drain_queue(self):
+        drained = []
+        while True:
+            try:
+                drained.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if drained:
+            with self.pending_lock:
+                self.add_pending(drained)
+            for _ in drained:
+                self.queue.task_done()
+        return drained
+
+    # Append (content, queued_at) items taken off the queue to the pending list; call with pending_lock held
+    def add_pending(self, items):
+        for content, queued_at in items:
+            self.pending.append(content)
+            if self.oldest_queued_at is None or queued_at < self.oldest_queued_at:
+                self.oldest_queued_at = queued_at
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if not self.pending:
+                try:
+                    first = self.queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                with self.pending_lock:
+                    self.add_pending([first])
+                self.queue.task_done()
+
+                # Coalesce anything else that arrives within the window into the same post
+                self.stop_event.wait(self.coalesce_window)
+            self.drain_queue()
+            self.save_pending()
+
+            with self.pending_lock:
+                batch = list(self.pending)
+                queued_at = self.oldest_queued_at
+            if self.deliver("".join(batch)):
+                if queued_at is not None:
+                    NOTIFICATION_DELIVERY_SECONDS.observe(time.monotonic() - queued_at)
+                with self.pending_lock:
+                    self.oldest_queued_at = None
+
+    # Post the content, the start of the pending list, to the webhook, split into as many messages as needed
+    # Each accepted message is removed from the pending list right away, so if stop() interrupts the delivery
+    # only the part Discord has not accepted yet is saved and sent again after a restart
+    # Returns False if delivery was interrupted by stop()
+    def deliver(self, content):
+        delivered = 0
+        for chunk in split_message(content):
+            if not self.post(chunk):
+                return False
+            self.remove_delivered(len(chunk))
+            delivered += len(chunk)
+        # Whitespace split_message left off the end
+        self.remove_delivered(len(content) - delivered)
+        return True
+
+    # Remove the first `count` characters of the pending messages and persist the rest
+    def remove_delivered(self, count):
+        with self.pending_lock:
+            while count > 0 and self.pending:
+                if len(self.pending[0]) <= count:
+                    count -= len(self.pending.pop(0))
+                else:
+                    self.pending[0] = self.pending[0][count:]
+                    count = 0
+        self.save_pending()
+
+    # Post a single message, retrying until it is accepted or the dispatcher is stopped
+    # 429 responses wait for Discord's retry_after; network errors and 5xx responses back off exponentially
+    def post(self, content):
+        backoff = 1.0
+        while not self.stop_event.is_set():
+            try:
+                response = self.session.post(self.webhook_url, json={"content": content}, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                log(f"Failed to send Discord notification: {e}", level="error")
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+
+            if response.status_code in (200, 204):
+                self.sent_count += 1
+                NOTIFICATIONS_SENT.inc()
+                log("Discord notification sent successfully.")
+                return True
+            if response.status_code == 429:
+                self.rate_limited_count += 1
+                RATE_LIMITED.inc("discord")
+                try:
+                    retry_after = float(response.json().get("retry_after", 1))
+                except ValueError:
+                    retry_after = float(response.headers.get("Retry-After", 1))
+                log(f"Discord rate limit hit, retrying in {retry_after:.2f} s.", level="warning")
+                self.stop_event.wait(retry_after)
+                continue
+            if response.status_code >= 500:
+                log(f"Failed to send Discord notification. Status code: {response.status_code}", level="error")
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+
+            # Any other 4xx means the message itself was rejected; retrying would never succeed
+            log(f"Failed to send Discord notification. Status code: {response.status_code}", level="error")
+            return True
+        return False
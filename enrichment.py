@@ -0,0 +1,187 @@
+import time
+import threading
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from instrumentation import log, RATE_LIMITED, ENRICHMENT_CACHE, ENRICHMENT_TIMEOUTS
+from scan_scheduler import RequestBudget
+
+# Details attached to new-pair and activation notifications
+# For every pair in an alert the product, 24h stats and ticker endpoints are fetched in parallel, and whatever has
+# arrived when the deadline passes goes into the notification; the alert itself is never held back longer than that.
+# Responses are cached for a short while, so a burst of alerts about the same pairs does not repeat requests, and
+# lookups that miss the deadline keep running and fill the cache for the next alert.
+# Requests are drawn from their own token bucket, sized for one alert's worth of lookups, and a scan announcing more
+# than max_pairs pairs (a first run, or a bulk listing) gets no details at all rather than a queue of requests.
+
+# Coinbase Exchange public market data
+EXCHANGE_URL = "https://api.exchange.coinbase.com"
+
+# Endpoints fetched for each pair, relative to the base URL
+ENDPOINTS = {
+    "product": "/products/{pair}",
+    "stats": "/products/{pair}/stats",
+    "ticker": "/products/{pair}/ticker",
+}
+
+# Cache that forgets entries after `ttl` seconds and evicts the least recently used one beyond `maxsize`
+class TTLCache:
+    def __init__(self, maxsize=256, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Returns the cached value, or None when it is missing or expired
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+def format_number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if number >= 1000:
+        return f"{number:,.0f}"
+    return f"{number:.8g}"
+
+# One line of details for a pair from whichever of its responses arrived in time; empty when none did
+def format_details(product, stats, ticker):
+    parts = []
+    price = format_number((ticker or {}).get("price") or (stats or {}).get("last"))
+    if price:
+        parts.append(f"Price {price}")
+    if stats:
+        low, high, volume = format_number(stats.get("low")), format_number(stats.get("high")), format_number(stats.get("volume"))
+        if volume:
+            parts.append(f"24h vol {volume}")
+        if low and high:
+            parts.append(f"24h range {low}-{high}")
+    if product:
+        increment = format_number(product.get("base_increment"))
+        minimum = format_number(product.get("base_min_size"))
+        if increment:
+            parts.append(f"base increment {increment}")
+        if minimum:
+            parts.append(f"min size {minimum}")
+        elif format_number(product.get("min_market_funds")):
+            parts.append(f"min funds {format_number(product.get('min_market_funds'))}")
+    return " | ".join(parts)
+
+# Fetches and formats details for changed pairs within a deadline
+# The base URL can point at a local stand-in API for testing
+class Enricher:
+    def __init__(self, base_url=EXCHANGE_URL, deadline=1.0, max_workers=8, cache_size=256, ttl=30.0, timeout=5,
+                 max_pairs=5, requests_per_second=3.0):
+        self.base_url = base_url.rstrip("/")
+        self.deadline = deadline
+        self.timeout = timeout
+        self.max_pairs = max_pairs
+        self.budget = RequestBudget(requests_per_second, max_pairs * len(ENDPOINTS))
+        self.cache = TTLCache(cache_size, ttl)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+        self.session.headers.update({"Accept": "application/json"})
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="enrichment")
+        # Lookups started but not finished yet, so an alert arriving meanwhile waits on them instead of repeating them
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    # Fetch one endpoint; None when it failed
+    def fetch(self, path):
+        try:
+            response = self.session.get(self.base_url + path, timeout=self.timeout)
+            if response.status_code == 429:
+                RATE_LIMITED.inc("enrichment")
+                return None
+            response.raise_for_status()
+            value = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log(f"Error fetching {path}: {e}", level="warning")
+            return None
+        self.cache.put(path, value)
+        return value
+
+    def finish(self, path):
+        with self.lock:
+            self.in_flight.pop(path, None)
+
+    # Cached value for path, or a future fetching it
+    # (None, None) when a new request would exceed the request budget
+    def lookup(self, path):
+        value = self.cache.get(path)
+        if value is not None:
+            ENRICHMENT_CACHE.inc("hit")
+            return value, None
+        with self.lock:
+            future = self.in_flight.get(path)
+            if future is None:
+                if not self.budget.try_acquire():
+                    ENRICHMENT_CACHE.inc("throttled")
+                    return None, None
+                future = self.in_flight[path] = self.executor.submit(self.fetch, path)
+                future.add_done_callback(lambda future, path=path: self.finish(path))
+        ENRICHMENT_CACHE.inc("miss")
+        return None, future
+
+    # Details for each pair as {pair: line}, waiting at most `deadline` seconds for all of them together,
+    # or until the time.monotonic() value `until` when several calls share one deadline
+    # Pairs whose responses all missed the deadline are left out, and more than max_pairs pairs get no details
+    def enrich(self, pairs, until=None):
+        if len(pairs) > self.max_pairs:
+            log(f"Skipping details for {len(pairs)} pairs, more than the {self.max_pairs} looked up at once.")
+            return {}
+        if until is None:
+            until = time.monotonic() + self.deadline
+        lookups = {(pair, name): self.lookup(path.format(pair=pair)) for pair in pairs for name, path in ENDPOINTS.items()}
+        pending = [future for value, future in lookups.values() if future is not None]
+        if pending:
+            done, not_done = wait(pending, timeout=max(0.0, until - time.monotonic()))
+            if not_done:
+                ENRICHMENT_TIMEOUTS.inc()
+                log(f"Enrichment deadline of {self.deadline} s passed for {len(not_done)} of {len(pending)} lookups.", level="warning")
+
+        details = {}
+        for pair in pairs:
+            results = {}
+            for name in ENDPOINTS:
+                value, future = lookups[(pair, name)]
+                if future is not None and future.done():
+                    value = future.result()
+                results[name] = value
+            line = format_details(results["product"], results["stats"], results["ticker"])
+            if line:
+                details[pair] = line
+        return details
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+if __name__ == "__main__":
+    import sys
+    enricher = Enricher(deadline=5.0)
+    for pair, line in enricher.enrich(sys.argv[1:] or ["BTC-USD"]).items():
+        print(f"{pair}: {line}")
+    enricher.close()
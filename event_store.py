@@ -0,0 +1,225 @@
+import os
+import sys
+import queue
+import sqlite3
+import argparse
+import threading
+import time
+from datetime import datetime
+from instrumentation import log
+
+# Event kinds recorded by the scanner
+EVENT_NEW_PAIR = "new_pair"
+EVENT_ENABLED = "enabled"
+EVENT_DISABLED = "disabled"
+EVENT_FIELD_CHANGE = "field_change"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    pair TEXT NOT NULL,
+    quote TEXT,
+    field TEXT,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS events_pair_ts ON events (pair, ts);
+CREATE INDEX IF NOT EXISTS events_field_ts ON events (field, ts);
+CREATE INDEX IF NOT EXISTS events_kind_ts ON events (kind, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def connect(path):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+# Build an event row; the quote currency is taken from the pair id (e.g. BTC-USD -> USD)
+def make_event(ts, kind, pair, field=None, value=None):
+    return (ts, kind, pair, pair.rsplit('-', 1)[-1] if '-' in pair else None, field, value)
+
+# Structured, indexed history of everything the scanner detects, stored in SQLite (WAL mode)
+# record() only queues a scan's events; a background thread inserts each batch in a single transaction,
+# so writing history never adds latency to the scan itself
+class EventStore:
+    def __init__(self, path):
+        self.path = path
+        self.connection = connect(path)
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self.run, name="event-store", daemon=True)
+        self.worker.start()
+
+    # Queue one scan's events (rows from make_event) for insertion
+    def record(self, events):
+        if events:
+            self.queue.put(list(events))
+
+    def run(self):
+        stop = False
+        while not stop:
+            # Anything else already queued goes into the same transaction
+            batches = [self.queue.get()]
+            while True:
+                try:
+                    batches.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batches
+            rows = [event for batch in batches if batch for event in batch]
+            try:
+                if rows:
+                    with self.connection:
+                        self.connection.executemany(
+                            "INSERT INTO events (ts, kind, pair, quote, field, value) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error as e:
+                log(f"Error writing events to {self.path}: {e}", level="error")
+            for _ in batches:
+                self.queue.task_done()
+
+    # Wait until every queued batch has been written
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        if self.worker.is_alive():
+            self.queue.put(None)
+            self.worker.join()
+        self.connection.close()
+
+    # Query events, newest first
+    # Every argument is optional; since/until are unix timestamps
+    def query(self, pair=None, field=None, kind=None, value=None, quote=None, since=None, until=None, limit=None):
+        return query_events(self.path, pair=pair, field=field, kind=kind, value=value, quote=quote, since=since, until=until, limit=limit)
+
+def query_events(path, pair=None, field=None, kind=None, value=None, quote=None, since=None, until=None, limit=None):
+    clauses = []
+    params = []
+    for column, wanted in (("pair", pair), ("field", field), ("kind", kind), ("value", value), ("quote", quote)):
+        if wanted is not None:
+            clauses.append(f"{column} = ?")
+            params.append(wanted)
+    if since is not None:
+        clauses.append("ts >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("ts < ?")
+        params.append(until)
+    sql = "SELECT ts, kind, pair, quote, field, value FROM events"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY ts DESC, id DESC"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return connection.execute(sql, params).fetchall()
+    finally:
+        connection.close()
+
+# Parse one line of the old text logs into an event row, or None if it isn't one we recognise
+# The logs use '%m-%d-%y %H:%M:%S - ...' timestamps:
+#   new_pairs.txt:     '<ts> - BTC-USD'
+#   activations.txt:   '<ts> - BTC-USD has been enabled' / '... has been disabled'
+#   field_changes.txt: '<ts> - BTC-USD post_only changed to True'
+def parse_log_line(filename, line):
+    line = line.rstrip("\n")
+    if " - " not in line:
+        return None
+    stamp, rest = line.split(" - ", 1)
+    try:
+        ts = datetime.strptime(stamp, '%m-%d-%y %H:%M:%S').timestamp()
+    except ValueError:
+        return None
+    if filename == "new_pairs.txt":
+        return make_event(ts, EVENT_NEW_PAIR, rest.strip())
+    if filename == "activations.txt":
+        pair, _, state = rest.partition(" has been ")
+        if state in ("enabled", "disabled"):
+            return make_event(ts, EVENT_ENABLED if state == "enabled" else EVENT_DISABLED, pair)
+        return None
+    if filename == "field_changes.txt":
+        head, sep, value = rest.partition(" changed to ")
+        if not sep or " " not in head:
+            return None
+        pair, field = head.split(" ", 1)
+        return make_event(ts, EVENT_FIELD_CHANGE, pair, field, value)
+    return None
+
+# One-time import of new_pairs.txt, activations.txt and field_changes.txt into the event store
+# The import is recorded in the meta table so running it again does nothing unless forced
+def import_text_logs(path, directory, force=False):
+    connection = connect(path)
+    try:
+        if not force and connection.execute("SELECT 1 FROM meta WHERE key = 'text_logs_imported'").fetchone():
+            log("Text logs have already been imported.")
+            return 0
+        imported = 0
+        with connection:
+            for filename in ("new_pairs.txt", "activations.txt", "field_changes.txt"):
+                try:
+                    with open(os.path.join(directory, filename), "r") as file:
+                        rows = [row for row in (parse_log_line(filename, line) for line in file) if row is not None]
+                except FileNotFoundError:
+                    continue
+                connection.executemany(
+                    "INSERT INTO events (ts, kind, pair, quote, field, value) VALUES (?, ?, ?, ?, ?, ?)", rows)
+                imported += len(rows)
+                log(f"Imported {len(rows)} events from {filename}.", imported=len(rows), filename=filename)
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('text_logs_imported', ?)", (str(time.time()),))
+        return imported
+    finally:
+        connection.close()
+
+# Command line interface
+#   python event_store.py import                        import the old text logs once
+#   python event_store.py query --field auction_mode --value True --days 90
+#   python event_store.py query --pair XYZ-USD          full timeline of one pair
+def main(argv=None):
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Query the scanner's event history.")
+    parser.add_argument("--db", default=os.path.join(script_dir, "events.db"), help="path to the event database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="import new_pairs.txt, activations.txt and field_changes.txt")
+    import_parser.add_argument("--dir", default=script_dir, help="directory containing the text logs")
+    import_parser.add_argument("--force", action="store_true", help="import again even if already imported")
+
+    query_parser = subparsers.add_parser("query", help="list matching events, newest first")
+    query_parser.add_argument("--pair")
+    query_parser.add_argument("--quote")
+    query_parser.add_argument("--field")
+    query_parser.add_argument("--value")
+    query_parser.add_argument("--kind", choices=[EVENT_NEW_PAIR, EVENT_ENABLED, EVENT_DISABLED, EVENT_FIELD_CHANGE])
+    query_parser.add_argument("--days", type=float, help="only events from the last N days")
+    query_parser.add_argument("--limit", type=int)
+
+    args = parser.parse_args(argv)
+    if args.command == "import":
+        import_text_logs(args.db, args.dir, force=args.force)
+        return 0
+
+    if not os.path.exists(args.db):
+        print(f"{args.db} does not exist yet.")
+        return 1
+    since = time.time() - args.days * 86400 if args.days is not None else None
+    rows = query_events(args.db, pair=args.pair, field=args.field, kind=args.kind, value=args.value,
+                        quote=args.quote, since=since, limit=args.limit)
+    for ts, kind, pair, quote, field, value in rows:
+        stamp = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+        if kind == EVENT_FIELD_CHANGE:
+            print(f"{stamp} - {pair} {field} changed to {value}")
+        elif kind == EVENT_NEW_PAIR:
+            print(f"{stamp} - {pair} detected")
+        else:
+            print(f"{stamp} - {pair} has been {kind}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,49 @@
 import os
+import queue
+import asyncio
+import threading
 from datetime import datetime
 import time
-import requests
 from dotenv import load_dotenv
+from artifacts import ARTIFACTS, ArtifactWriter, QuoteView
+from product_state import ProductIndex, ProductTable, STATUS_FIELDS
+from event_store import EventStore, import_text_logs, make_event, EVENT_NEW_PAIR, EVENT_ENABLED, EVENT_DISABLED, EVENT_FIELD_CHANGE
+from discord_notifier import DiscordNotifier
+from shared_state import SqliteSharedState
+from enrichment import Enricher
+from snapshot_archive import SnapshotArchive
+from status_stream import StatusStream
+from venues import PRIMARY_VENUE, CoinbaseExchangeAdapter, VenueFetcher, make_adapters, split_key
+from scan_scheduler import ScanScheduler, SCAN_CHANGED, SCAN_UNCHANGED, SCAN_ERROR, SCAN_RATE_LIMITED, SCAN_SKIPPED
+from instrumentation import (log, start_metrics_server, REGISTRY, STAGE_SECONDS, SCANS, FAST_PATH, CHANGES, ERRORS,
+                             DETECTION_LAG)
 
 # Load environment variables from .env file
 # Ensure you have a .env file in the same directory as this script with the following variables:
 # DISCORD_WEBHOOK_URL: The webhook URL to send notifications to Discord
 # MENTION_ROLE: The role to mention in Discord when sending notifications (e.g., @everyone or a specific role ID)
+# Optional scheduler settings (seconds unless noted):
+# SCAN_INTERVAL (default 2), BURST_INTERVAL (default 1), BURST_DURATION (default 300),
+# REQUESTS_PER_SECOND: request budget that keeps us under the exchange's public rate limit (default 3)
+# INGEST_MODE: "poll" (default) polls /products, "stream" follows the WebSocket status channel instead
+# RECONCILE_INTERVAL: how often stream mode re-checks the full /products list over REST (default 60)
+# QUOTE_CURRENCIES: comma-separated quote currencies to watch, or "all" (default USD)
+# DISCORD_WEBHOOK_URL_<QUOTE>: optional webhook for one quote currency's notifications, e.g. DISCORD_WEBHOOK_URL_USDC
+# VENUES: comma-separated venues to watch (default coinbase); see venues.py for the others,
+# e.g. coinbase,coinbase-advanced,coinbase-international,binance
+# METRICS_PORT: serve Prometheus metrics on http://127.0.0.1:<port>/metrics (METRICS_HOST to bind elsewhere)
+# LOG_FORMAT: "text" (default) or "json" for one JSON object per log line
+# BUILD_WATCHLIST: "true" to rebuild and upload the TradingView watchlists in-process whenever listings change
+# (WATCHLIST_WEBHOOK_URL: webhook the watchlist file is uploaded to)
+# Running several instances (see shared_state.py):
+# SHARED_STATE: path of the SQLite file the instances share to notify each change once and elect the file writer
+# INSTANCE_INDEX / INSTANCE_COUNT: this instance's slot, so instance i of N scans at i/N of the way through each interval
+# INSTANCE_ID: name of this instance in the shared state (default hostname-pid)
+# WRITER_LEASE_TTL: seconds the file writer's lease lasts without renewal (default 10)
+# ENRICHMENT_DEADLINE: seconds a new-pair or activation alert may wait for price, 24h stats and size details
+# before it is sent without them (default 1, 0 turns the details off)
+# ARCHIVE: path of an SQLite archive of every product state seen, e.g. archive.db (off by default; see snapshot_archive.py)
+# ARCHIVE_RETENTION_DAYS: how long archived states are kept (default 365)
 load_dotenv()
 
 # Your Discord webhook URL and role mention
@@ -18,265 +54,684 @@ mentionrole = os.getenv('MENTION_ROLE')
 # This will automatically point to the directory where the script is being executed
 script_dir = os.path.dirname(os.path.realpath(__file__))
 
+# Coinbase Pro API endpoint to fetch product data
+PRODUCTS_URL = "https://api.pro.coinbase.com/products"
+
+# Quote currencies to watch; None means every quote currency in the payload
+QUOTE_CURRENCIES = os.getenv('QUOTE_CURRENCIES', 'USD')
+QUOTE_CURRENCIES = None if QUOTE_CURRENCIES.strip().lower() == 'all' else tuple(quote.strip().upper() for quote in QUOTE_CURRENCIES.split(',') if quote.strip())
+
+# Background Discord dispatchers by webhook URL, created on first use
+# Undelivered notifications are kept in pending_notifications.json (or pending_notifications_<QUOTE>.json for a
+# quote-specific webhook) and retried after a restart
+notifiers = {}
+REGISTRY.gauge("pair_scanner_notification_queue_depth", "Discord notifications queued or pending delivery.",
+               function=lambda: sum(notifier.queue.qsize() + len(notifier.pending) for notifier in list(notifiers.values())))
+
 # Function to send a notification to Discord
-# This function takes the content (text) to be sent to Discord and posts it to the webhook URL
-def send_discord_notification(content):
-    if content.strip():
-        data = {"content": content}
-        response = requests.post(DISCORD_WEBHOOK_URL, json=data)
-        if response.status_code == 204:
-            print("Discord notification sent successfully.")
-        else:
-            print(f"Failed to send Discord notification. Status code: {response.status_code}")
+# This function takes the content (text) to be sent to Discord and queues it for the background dispatcher,
+# so it returns immediately and never waits on the webhook
+# Notifications for a quote currency go to DISCORD_WEBHOOK_URL_<QUOTE> when it is set, otherwise to DISCORD_WEBHOOK_URL
+def send_discord_notification(content, quote='USD'):
+    webhook_url = os.getenv(f'DISCORD_WEBHOOK_URL_{quote}')
+    pending_file = f"pending_notifications_{quote}.json"
+    if not webhook_url:
+        webhook_url = DISCORD_WEBHOOK_URL
+        pending_file = "pending_notifications.json"
+    notifier = notifiers.get(webhook_url)
+    if notifier is None:
+        notifier = DiscordNotifier(webhook_url, os.path.join(script_dir, pending_file))
+        notifier.start()
+        notifiers[webhook_url] = notifier
+    notifier.send(content)
 
-# Function to fetch all trading pairs from Coinbase Pro API
-# It filters the pairs to only include those quoted in USD, and then separates them into traded and disabled pairs
-def fetch_usd_pairs():
-    start_time = time.time()  # Start measuring time
-    url = "https://api.pro.coinbase.com/products"  # Coinbase Pro API endpoint to fetch product data
-    
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from Coinbase Pro API: {e}")
-        return
-    
-    products = response.json()
-    
-    # Filter out only USD pairs
-    usd_pairs = [product for product in products if product['quote_currency'] == 'USD']
-    
-    # Separate traded and disabled pairs
-    traded_pairs = sorted([pair['id'] for pair in usd_pairs if not pair['trading_disabled']])
-    disabled_pairs = sorted([pair['id'] for pair in usd_pairs if pair['trading_disabled']])
-    
-    # Load previously saved pairs if the file exists
-    previous_traded_pairs = set()
-    previous_disabled_pairs = set()
-    fields_status = {}
-    pairs_file_path = os.path.join(script_dir, "pairs.txt")
-    fields_status_file_path = os.path.join(script_dir, "fields_status.txt")
+# Saved state for one quote currency of one venue: its traded/disabled pairs as last written to its pairs file
+# Loaded from disk once, when the quote is first watched, and kept in memory afterwards
+# Coinbase Exchange quotes keep their plain file names (pairs.txt, pairs_USDC.txt, ...); other venues' files
+# are labelled with the venue as well, e.g. pairs_BINANCE-USDT.txt
+class QuoteState:
+    def __init__(self, directory, quote, venue=PRIMARY_VENUE):
+        self.quote = quote
+        self.venue = venue
+        self.label = quote if venue == PRIMARY_VENUE else f"{venue.upper()}-{quote}"
+        self.directory = directory
+        self.traded_pairs = set()
+        self.disabled_pairs = set()
+        # Sorted traded and disabled pairs the artifacts were last rendered from; None until the first scan
+        self.rendered = None
+        self.load()
 
-    try:
-        with open(pairs_file_path, "r") as file:
-            lines = file.readlines()
-            traded_section = False
-            disabled_section = False
-            for line in lines:
-                if line.strip() == "Traded Pairs:":
-                    traded_section = True
-                    disabled_section = False
-                    continue
-                elif line.strip() == "Disabled Pairs:":
-                    traded_section = False
-                    disabled_section = True
+    # Path of one of this quote's artifacts
+    def path(self, artifact):
+        return os.path.join(self.directory, artifact.filename(self.label))
+
+    def load(self):
+        filename = ARTIFACTS['pairs'].filename(self.label)
+        try:
+            with open(self.path(ARTIFACTS['pairs']), "r") as file:
+                traded_section = False
+                disabled_section = False
+                for line in file:
+                    if line.strip() == "Traded Pairs:":
+                        traded_section = True
+                        disabled_section = False
+                        continue
+                    elif line.strip() == "Disabled Pairs:":
+                        traded_section = False
+                        disabled_section = True
+                        continue
+
+                    if traded_section and line.strip():
+                        self.traded_pairs.add(line.strip())
+                    if disabled_section and line.strip():
+                        self.disabled_pairs.add(line.strip())
+        except FileNotFoundError:
+            log(f"{filename} not found, creating a new one.")
+
+# Long-lived scanner that keeps the previous scan's state in memory
+# The state files are read once at startup, and afterwards they are only written (never re-read)
+# when the state actually changes, so a steady-state scan does no file I/O at all
+class PairScanner:
+    def __init__(self, directory=script_dir, url=PRODUCTS_URL, notify=send_discord_notification, quote_currencies=QUOTE_CURRENCIES, event_store=None,
+                 watchlist_builder=None, venues=None, shared_state=None, lease_ttl=10.0,
+                 enricher=None, archive=None):
+        self.directory = directory
+        self.url = url
+        self.notify = notify
+        self.quote_currencies = quote_currencies
+
+        # Optional in-process tradingview_watchlist_builder.WatchlistBuilder, handed a quote currency's watchlist
+        # whenever its traded pairs change so the published watchlists follow listings within seconds
+        self.watchlist_builder = watchlist_builder
+
+        # History of detected changes goes to an indexed SQLite event store (events.db) instead of text logs
+        # The old new_pairs.txt / activations.txt / field_changes.txt logs are imported into it once
+        if event_store is None:
+            logs = ("new_pairs.txt", "activations.txt", "field_changes.txt")
+            if not os.path.exists(self.path("events.db")) and any(os.path.exists(self.path(filename)) for filename in logs):
+                import_text_logs(self.path("events.db"), directory)
+            event_store = EventStore(self.path("events.db"))
+        self.events = event_store
+
+        # Venues are fetched concurrently, each over one pooled keep-alive session reused for every scan
+        # This avoids a new TCP/TLS handshake against each API every 2 seconds
+        # Validators and a payload hash from each venue's last processed response are sent back as
+        # If-None-Match / If-Modified-Since or compared against the raw body, to skip decoding an identical payload
+        # Without explicit venues only Coinbase Exchange is watched, at `url`
+        self.fetcher = VenueFetcher(venues if venues is not None else [CoinbaseExchangeAdapter(url)])
+
+        # Counters for how many scans ran and how many ended early on the fast path (304 or identical payload)
+        self.scan_count = 0
+        self.fast_path_count = 0
+
+        # Seconds spent in each stage (fetch, decode, filter, diff, render, write, notify) during the last scan
+        self.stage_times = {}
+
+        # Start time of the last REST fetch; the gap to the one before bounds how long a change could go unseen
+        self.last_fetch_time = None
+
+        # In-memory copy of what is persisted: one QuoteState per watched quote currency,
+        # and the field statuses of every watched pair in fields_status.txt
+        # Field statuses are held as a compact ProductTable (bitmask + interned codes per product)
+        self.quotes = {}
+        self.product_index = ProductIndex()
+        self.fields_status = ProductTable(self.product_index)
+
+        # Derived output files are staged during a scan and written together at the end of it,
+        # skipping any whose content hash has not changed
+        self.artifacts = ArtifactWriter()
+
+        # Latest known product records by id, so partial updates from the WebSocket status channel
+        # can be merged into a full snapshot before running the same detection logic
+        # None until the first REST scan, since the status channel alone can't be trusted for every field
+        self.products = None
+
+        # Optional state shared with other scanner instances (e.g. shared_state.SqliteSharedState)
+        # Every change is claimed there before it is notified or recorded, so only one instance announces it,
+        # and only the instance holding the writer lease writes the derived files
+        # Without one this instance announces everything it detects and always writes
+        self.shared = shared_state
+        self.lease_ttl = lease_ttl
+        self.is_writer = shared_state is None
+        # Set when this instance becomes the writer: seed the shared state from our own on the next processed scan
+        self.seed_pending = False
+
+        # Optional enrichment.Enricher adding market details to alerts about new and newly enabled pairs
+        # With one, notifications wait for their details on a delivery thread, so neither the scheduler's next tick
+        # nor the next streamed update waits for them; a single thread keeps them in order
+        self.enricher = enricher
+        self.delivery = None
+        if enricher is not None:
+            self.delivery = queue.Queue()
+            self.delivery_worker = threading.Thread(target=self.run_delivery, name="notification-delivery", daemon=True)
+            self.delivery_worker.start()
+
+        # Optional snapshot_archive.SnapshotArchive receiving the products of every processed scan
+        # With several instances only the writer archives, so the frames come from one source at a time
+        self.archive = archive
+
+        # REST scans and streamed updates may run on different threads; only one may touch the state at a time
+        self.lock = threading.Lock()
+
+        self.load()
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    # Add the time spent since `started` (a time.perf_counter() value) to a stage of the current scan
+    def add_stage_time(self, stage, started):
+        self.stage_times[stage] = self.stage_times.get(stage, 0.0) + time.perf_counter() - started
+
+    # Write every staged output file, timed as the "write" stage
+    def write_outputs(self):
+        started = time.perf_counter()
+        self.artifacts.commit()
+        self.add_stage_time("write", started)
+
+    # Hand a notification to the notifier, timed as the "notify" stage
+    def send_notification(self, content, quote):
+        started = time.perf_counter()
+        self.notify(content, quote)
+        self.add_stage_time("notify", started)
+
+    # Load previously saved state once at startup
+    # Missing files simply start out empty and are created on the first scan
+    # With "all" quote currencies, each quote's files are loaded the first time that quote shows up instead
+    def load(self):
+        for quote in self.quote_currencies or ():
+            self.quote_state(quote)
+
+        try:
+            with open(self.path("fields_status.txt"), "r") as file:
+                for line in file:
+                    pair_id, statuses_str = line.strip().split(":", 1)
+                    self.fields_status.add_statuses(pair_id, dict(field.split("=") for field in statuses_str.split(",") if "=" in field))
+        except FileNotFoundError:
+            log("fields_status.txt not found, creating a new one.")
+
+    def quote_state(self, quote, venue=PRIMARY_VENUE):
+        state = self.quotes.get((venue, quote))
+        if state is None:
+            state = self.quotes[(venue, quote)] = QuoteState(self.directory, quote, venue)
+        return state
+
+    # Take or renew the writer lease
+    # An instance that has just become the writer has not been writing its files, so it forgets what it knows about
+    # them and processes the next payload in full: every artifact is re-rendered and fields_status.txt rewritten
+    def acquire_writer(self):
+        if self.shared is None:
+            return
+        was_writer, self.is_writer = self.is_writer, self.shared.acquire_lease(self.lease_ttl)
+        if self.is_writer and not was_writer:
+            log("Took over as the writer of the derived files.")
+            self.artifacts.hashes.clear()
+            for state in self.quotes.values():
+                state.rendered = None
+            self.seed_pending = True
+            self.fetcher.reset()
+            if self.archive is not None:
+                self.archive.reload()
+        elif was_writer and not self.is_writer:
+            log("Lost the writer lease to another instance.", level="warning")
+
+    # Claim detected changes in the shared state; returns the subsets this instance won and should announce
+    # Transitions are (pair, field, new value): listings and traded/disabled moves use the "listed" and "traded"
+    # pseudo-fields next to the tracked fields. Delistings and the traded state of new pairs are claimed silently
+    # so the shared values stay current.
+    def claim_changes(self, new_pairs, removed_pairs, current_traded_pairs, moved_to_traded, moved_to_disabled, field_changes):
+        if self.shared is None:
+            return new_pairs, moved_to_traded, moved_to_disabled, field_changes
+        transitions = [(pair, "listed", "true") for pair in new_pairs]
+        transitions += [(pair, "traded", str(pair in current_traded_pairs).lower()) for pair in new_pairs]
+        transitions += [(pair, "listed", "false") for pair in removed_pairs]
+        transitions += [(pair, "traded", "true") for pair in moved_to_traded]
+        transitions += [(pair, "traded", "false") for pair in moved_to_disabled]
+        transitions += [(pair, field, value) for pair, changes in field_changes.items() for field, value in changes.items()]
+        won = self.shared.claim(transitions)
+        field_changes = {pair: {field: value for field, value in changes.items() if (pair, field, value) in won}
+                         for pair, changes in field_changes.items()}
+        return ({pair for pair in new_pairs if (pair, "listed", "true") in won},
+                {pair for pair in moved_to_traded if (pair, "traded", "true") in won},
+                {pair for pair in moved_to_disabled if (pair, "traded", "false") in won},
+                {pair: changes for pair, changes in field_changes.items() if changes})
+
+    def seed_shared_state(self, watched_pairs, fields_status):
+        started = time.perf_counter()
+        rows = [(pair_id, field, value) for pair_id, statuses in fields_status.to_fields_status().items() for field, value in statuses.items()]
+        rows += [(pair['id'], "listed", "true") for pair in watched_pairs]
+        rows += [(pair['id'], "traded", str(not pair['trading_disabled']).lower()) for pair in watched_pairs]
+        self.shared.seed(rows)
+        self.seed_pending = False
+        self.add_stage_time("write", started)
+
+    # Fetch all trading pairs from every venue
+    # Returns the scan outcome and the merged product list, which is None when the scan ended early
+    def fetch_products(self, start_time):
+        result, products = self.fetcher.fetch()
+        self.stage_times["fetch"] = self.fetcher.fetch_time
+        self.stage_times["decode"] = self.fetcher.decode_time
+        if result in (SCAN_ERROR, SCAN_RATE_LIMITED):
+            if result == SCAN_ERROR:
+                ERRORS.inc()
+            return result, None
+        if result == SCAN_SKIPPED:
+            log(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - Scan skipped: every venue is backing off or still busy.", skipped=True)
+            return result, None
+
+        # Fast path: no venue's payload changed, so the scan ends here before any set building
+        if products is None:
+            self.fast_path_count += 1
+            FAST_PATH.inc()
+            elapsed_time = (time.time() - start_time) * 1000
+            log(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {elapsed_time:.2f} ms - No new pairs found this scan. (fast path {self.fast_path_count}/{self.scan_count} scans)",
+                elapsed_ms=round(elapsed_time, 2), fast_path=True)
+            return SCAN_UNCHANGED, None
+        return SCAN_CHANGED, products
+
+    # Notification suffix linking to a product's trading page, when its venue has one
+    def product_link(self, pair_id):
+        url = self.fetcher.product_url(pair_id)
+        return f"\n<{url}>" if url else ""
+
+    # Notification suffix with a pair's market details, when enrichment found any in time
+    def detail_line(self, details, pair_id):
+        return f"\n{details[pair_id]}" if pair_id in details else ""
+
+    # Run a single scan: fetch the products and compare them against the in-memory state
+    # Returns one of the SCAN_* outcomes
+    def scan(self):
+        start_time = time.time()  # Start measuring time
+        self.scan_count += 1
+        self.stage_times = {}
+        SCANS.inc()
+        previous_fetch_time, self.last_fetch_time = self.last_fetch_time, start_time
+        with self.lock:
+            self.acquire_writer()
+
+        result, products = self.fetch_products(start_time)
+        if products is None:
+            self.observe_stages(start_time)
+            return result
+
+        try:
+            with self.lock:
+                changed, notifications = self.process_products(products, start_time)
+        except Exception:
+            # Process the same payloads again on the next scan instead of skipping them
+            self.fetcher.reset()
+            ERRORS.inc()
+            raise
+        self.deliver(notifications)
+        if changed and previous_fetch_time is not None:
+            DETECTION_LAG.set(start_time - previous_fetch_time)
+        self.observe_stages(start_time)
+        # Polling faster would only make a rate-limited venue's backoff worse, so no burst is started meanwhile
+        return SCAN_CHANGED if changed and not self.fetcher.rate_limited() else SCAN_UNCHANGED
+
+    # Feed the last scan's stage times and total duration into the stage histogram
+    def observe_stages(self, start_time):
+        for stage, seconds in self.stage_times.items():
+            STAGE_SECONDS.observe(seconds, stage)
+        STAGE_SECONDS.observe(time.time() - start_time, "scan")
+
+    # Apply product updates pushed by the WebSocket status channel
+    # Each update is merged over the last known record for that product, so fields the channel does not carry
+    # keep their REST values, and the merged snapshot goes through the same detection logic as a REST scan
+    # Updates are dropped until the first REST scan has filled in the products: merged over nothing they would be
+    # compared against the saved state with made-up values. The channel repeats its snapshot, so nothing is lost.
+    def apply_status_update(self, updates):
+        start_time = time.time()
+        self.stage_times = {}
+        with self.lock:
+            if self.products is None:
+                log("Status update skipped until the first REST scan completes.")
+                return SCAN_UNCHANGED
+            self.acquire_writer()
+            products = dict(self.products)
+            for update in updates:
+                # The channel sends null for an empty status_message where REST sends ""; other nulls carry no value
+                update = {field: value for field, value in update.items() if value is not None or field == 'status_message'}
+                if 'status_message' in update and update['status_message'] is None:
+                    update['status_message'] = ''
+                known = products.get(update['id'])
+                if known is None and any(field not in update for field in STATUS_FIELDS):
+                    # A product only seen on the socket, without all its fields; the next REST scan picks it up
                     continue
-                
-                if traded_section and line.strip():
-                    previous_traded_pairs.add(line.strip())
-                if disabled_section and line.strip():
-                    previous_disabled_pairs.add(line.strip())
-    except FileNotFoundError:
-        print("pairs.txt not found, creating a new one.")
-    
-    try:
-        with open(fields_status_file_path, "r") as file:
-            for line in file:
-                pair_id, statuses_str = line.strip().split(":", 1)
-                fields_status[pair_id] = dict(field.split("=") for field in statuses_str.split(",") if "=" in field)
-    except FileNotFoundError:
-        print("fields_status.txt not found, creating a new one.")
-    
-    # Get the current pairs and field statuses
-    current_traded_pairs = set(traded_pairs)
-    current_disabled_pairs = set(disabled_pairs)
-    current_fields_status = {pair['id']: {
-        'post_only': str(pair['post_only']),
-        'limit_only': str(pair['limit_only']),
-        'cancel_only': str(pair['cancel_only']),
-        'status': str(pair['status']),
-        'status_message': str(pair['status_message']),
-        'trading_disabled': str(pair['trading_disabled']),
-        'auction_mode': str(pair['auction_mode'])
-    } for pair in usd_pairs}
-    
-    # Find new pairs
-    previous_pairs = previous_traded_pairs | previous_disabled_pairs
-    current_pairs = current_traded_pairs | current_disabled_pairs
-    new_pairs = current_pairs - previous_pairs
-
-    # Detect changes between traded and disabled pairs
-    moved_to_traded = previous_disabled_pairs & current_traded_pairs
-    moved_to_disabled = previous_traded_pairs & current_disabled_pairs
-
-    # Detect changes in specified fields (e.g., post_only, limit_only, etc.)
-    field_changes = {}
-    for pair_id, statuses in current_fields_status.items():
-        previous_statuses = fields_status.get(pair_id, {})
-        changes = {field: statuses[field] for field in statuses if statuses[field] != previous_statuses.get(field, None)}
-        if changes:
-            field_changes[pair_id] = changes
-
-    # Ensure pairs.txt and TV-Coinbase-Watchlist.txt are created and updated on the first run or when new pairs are found
-    # These files store the traded pairs and the corresponding TradingView watchlist format
-    tv_watchlist_file_path = os.path.join(script_dir, "TV-Coinbase-Watchlist.txt")
-    if not os.path.exists(pairs_file_path) or not os.path.exists(tv_watchlist_file_path) or new_pairs or moved_to_traded or moved_to_disabled or field_changes:
-        with open(pairs_file_path, "w") as file:
-            file.write("Traded Pairs:\n")
-            for pair in traded_pairs:
-                file.write(pair + "\n")
-            file.write("\nDisabled Pairs:\n")
-            for pair in disabled_pairs:
-                file.write(pair + "\n")
-        print("pairs.txt has been updated.")
-        
-        with open(tv_watchlist_file_path, "w") as file:
-            for pair in traded_pairs:
-                file.write(f"COINBASE:{pair.replace('-', '')},\n")
-        print("TV-Coinbase-Watchlist.txt has been updated.")
-        
-    # Only update active_pairs.txt if changes occurred
-    # This file stores all traded pairs with the '-USD' suffix
-    active_pairs_file_path = os.path.join(script_dir, "active_pairs.txt")
-    previous_active_pairs = set()
-    try:
-        with open(active_pairs_file_path, "r") as file:
-            previous_active_pairs = set(file.read().splitlines())
-    except FileNotFoundError:
-        print("active_pairs.txt not found, creating a new one.")
-
-    # Keep the '-USD' suffix and sort pairs alphabetically
-    current_active_pairs = sorted(traded_pairs)
-    if set(current_active_pairs) != previous_active_pairs:
-        with open(active_pairs_file_path, "w") as file:
-            for pair in current_active_pairs:
-                file.write(pair + "\n")
-        print("active_pairs.txt has been updated with traded pairs sorted alphabetically.")
-
-    # Update active_pairs_no_usd.txt similarly to active_pairs.txt but without the '-USD' suffix
-    # This file stores the traded pairs without the '-USD' suffix, useful for certain applications
-    active_pairs_no_usd_file_path = os.path.join(script_dir, "active_pairs_no_usd.txt")
-    previous_active_pairs_no_usd = set()
-    try:
-        with open(active_pairs_no_usd_file_path, "r") as file:
-            previous_active_pairs_no_usd = set(file.read().splitlines())
-    except FileNotFoundError:
-        print("active_pairs_no_usd.txt not found, creating a new one.")
-
-    # Remove '-USD' from each traded pair and sort them alphabetically
-    current_active_pairs_no_usd = sorted(pair.replace('-USD', '') for pair in traded_pairs)
-    if set(current_active_pairs_no_usd) != previous_active_pairs_no_usd:
-        with open(active_pairs_no_usd_file_path, "w") as file:
-            for pair in current_active_pairs_no_usd:
-                file.write(pair + "\n")
-        print("active_pairs_no_usd.txt has been updated with traded pairs without the '-USD' suffix.")
-
-    # Save new pairs with the date they were found to new_pairs.txt
-    # This helps in keeping track of when new pairs are introduced
-    new_pairs_file_path = os.path.join(script_dir, "new_pairs.txt")
-    if new_pairs:
-        with open(new_pairs_file_path, "a") as file:
-            for pair in new_pairs:
-                file.write(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair}\n")
-        content = ""
-        for pair in new_pairs:
-            if pair in traded_pairs:
-                content += f"{mentionrole} [Enabled] {pair} has been detected.\n<https://www.coinbase.com/advanced-trade/spot/{pair}>\n"
-            else:
-                content += f"{mentionrole} [Disabled] {pair} has been detected.\n"
-        send_discord_notification(content)
-        print("new_pairs.txt has been updated with new pairs.")
-    
-    # Log and notify about pairs moving between traded and disabled
-    # This logs the pairs that have been enabled or disabled and notifies via Discord
-    activations_file_path = os.path.join(script_dir, "activations.txt")
-    if moved_to_traded or moved_to_disabled:
-        content = ""
-        with open(activations_file_path, "a") as file:
+                product = {**(known or {}), **update}
+                product.setdefault('quote_currency', update['id'].rsplit('-', 1)[-1])
+                products[update['id']] = product
+            changed, notifications = self.process_products(list(products.values()), start_time)
+        self.deliver(notifications)
+        self.observe_stages(start_time)
+        return SCAN_CHANGED if changed else SCAN_UNCHANGED
+
+    # Send a processed scan's notifications, adding market details to the lines about new and enabled pairs
+    # Called after the state lock is released; with an enricher they are handed to the delivery thread instead
+    def deliver(self, notifications):
+        if not notifications:
+            return
+        if self.delivery is None:
+            for quote, lines in notifications:
+                self.send_notification("".join(f"{text}\n" for text, pair in lines), quote)
+            return
+        self.delivery.put(notifications)
+
+    def run_delivery(self):
+        while True:
+            notifications = self.delivery.get()
+            try:
+                if notifications is None:
+                    return
+                details = {}
+                pairs = sorted({pair for quote, lines in notifications for text, pair in lines if pair is not None})
+                if pairs:
+                    started = time.perf_counter()
+                    details = self.enricher.enrich(pairs)
+                    STAGE_SECONDS.observe(time.perf_counter() - started, "enrich")
+                for quote, lines in notifications:
+                    self.notify("".join(f"{text}{self.detail_line(details, pair)}\n" for text, pair in lines), quote)
+            except Exception as e:
+                log(f"Error delivering notifications: {e}", level="error")
+            finally:
+                self.delivery.task_done()
+
+    # Wait until every notification handed to the delivery thread has been passed on to the notifier
+    def flush_notifications(self):
+        if self.delivery is not None:
+            self.delivery.join()
+
+    # Pass on the queued notifications and stop the delivery thread
+    def close_delivery(self):
+        if self.delivery is not None and self.delivery_worker.is_alive():
+            self.delivery.put(None)
+            self.delivery_worker.join()
+
+    # Compare the decoded products against the previous state, then persist any changes and record them
+    # Returns whether anything changed, and the notifications for deliver() as [(quote, lines)], where each line is
+    # (text, pair whose market details belong after it, or None)
+    # The payload is indexed by quote currency once; each watched quote then gets its own traded/disabled split,
+    # output files and notifications, all from the same fetch
+    def process_products(self, products, start_time):
+        # Events detected in this scan, written to the event store as one batch at the end
+        events = []
+        scan_time = start_time
+
+        # Group the watched pairs by quote currency
+        started = time.perf_counter()
+        quote_index = {}
+        watch_all = self.quote_currencies is None
+        watched_quotes = self.quote_currencies or ()
+        for product in products:
+            quote = product['quote_currency']
+            if watch_all or quote in watched_quotes:
+                quote_index.setdefault((product.get('venue', PRIMARY_VENUE), quote), []).append(product)
+        watched_pairs = [pair for quote_pairs in quote_index.values() for pair in quote_pairs]
+        self.add_stage_time("filter", started)
+
+        # Detect changes in specified fields (e.g., post_only, limit_only, etc.) across every watched pair at once
+        # The tables are compared column-wise and only the products that differ are decoded
+        started = time.perf_counter()
+        current_fields_status = ProductTable(self.product_index)
+        current_fields_status.add_products(watched_pairs)
+        field_changes = current_fields_status.field_changes(self.fields_status)
+        group_of = {pair['id']: (pair.get('venue', PRIMARY_VENUE), pair['quote_currency']) for pair in watched_pairs} if field_changes else {}
+        self.add_stage_time("diff", started)
+
+        # First pass: detect every quote's changes and stage its derived files (pairs file, TradingView watchlist,
+        # active pairs lists and any registered plugins); nothing in memory changes yet
+        detected = []
+        for venue, quote in sorted(quote_index):
+            started = time.perf_counter()
+            quote_pairs = quote_index[(venue, quote)]
+            state = self.quote_state(quote, venue)
+            quote_field_changes = {pair_id: changes for pair_id, changes in field_changes.items() if group_of[pair_id] == (venue, quote)}
+
+            # Separate traded and disabled pairs
+            traded_pairs = sorted([pair['id'] for pair in quote_pairs if not pair['trading_disabled']])
+            disabled_pairs = sorted([pair['id'] for pair in quote_pairs if pair['trading_disabled']])
+
+            # Get the current pairs
+            current_traded_pairs = set(traded_pairs)
+            current_disabled_pairs = set(disabled_pairs)
+
+            # Find new pairs
+            previous_pairs = state.traded_pairs | state.disabled_pairs
+            current_pairs = current_traded_pairs | current_disabled_pairs
+            new_pairs = current_pairs - previous_pairs
+
+            # Detect changes between traded and disabled pairs
+            moved_to_traded = state.disabled_pairs & current_traded_pairs
+            moved_to_disabled = state.traded_pairs & current_disabled_pairs
+            self.add_stage_time("diff", started)
+
+            # Artifacts are only rendered when their inputs changed, and only staged for writing when the rendered
+            # content differs from what is on disk; only the writer instance writes them
+            started = time.perf_counter()
+            rendered = (traded_pairs, disabled_pairs)
+            pairs_changed = rendered != state.rendered
+            if self.is_writer and (pairs_changed or quote_field_changes):
+                # Files list each venue's own symbols (BNB-USDT, not binance/BNB-USDT)
+                if venue == PRIMARY_VENUE:
+                    view = QuoteView(quote, traded_pairs, disabled_pairs, quote_pairs)
+                else:
+                    view = QuoteView(quote, [split_key(pair)[1] for pair in traded_pairs], [split_key(pair)[1] for pair in disabled_pairs],
+                                     quote_pairs, venue, self.fetcher.tradingview_prefix(venue))
+                for artifact in list(ARTIFACTS.values()):
+                    if pairs_changed or artifact.uses_statuses:
+                        filename = artifact.filename(state.label)
+                        message = artifact.message.format(filename=filename, quote=quote) if artifact.message else None
+                        self.artifacts.stage(state.path(artifact), artifact.render(view), message)
+            self.add_stage_time("render", started)
+
+            # Details are only looked up for Coinbase Exchange pairs, and not for a quote seen for the first time,
+            # whose every pair is new
+            enrich = venue == PRIMARY_VENUE and bool(previous_pairs)
+
+            detected.append((venue, quote, state, rendered, pairs_changed, current_traded_pairs, current_disabled_pairs,
+                             new_pairs, previous_pairs - current_pairs, moved_to_traded, moved_to_disabled, quote_field_changes, enrich))
+
+        # Update the fields_status file with the current statuses to prevent repeated notifications
+        # Alphabetize by pair_id for consistency, and write atomically so a crash can't leave a truncated file
+        # behind that would make every pair look changed on the next start
+        if self.is_writer and (field_changes or self.seed_pending):
+            sorted_pairs = current_fields_status.to_fields_status().items()
+            self.artifacts.stage(self.path("fields_status.txt"), "".join(f"{pair_id}:{','.join(f'{k}={v}' for k, v in statuses.items())}\n" for pair_id, statuses in sorted_pairs))
+
+        # Write everything before any state changes or notifications: if a write fails, the exception leaves the
+        # in-memory state as it was and the staged files queued, so the retry detects the same changes, writes the
+        # files and notifies once
+        self.write_outputs()
+
+        # Second pass: the files are written, so update the in-memory state, then claim, record and notify
+        all_new_pairs = set()
+        all_moved_to_traded = set()
+        all_moved_to_disabled = set()
+        notifications = []
+        for (venue, quote, state, rendered, pairs_changed, current_traded_pairs, current_disabled_pairs,
+             new_pairs, removed_pairs, moved_to_traded, moved_to_disabled, quote_field_changes, enrich) in detected:
+            if self.is_writer and (pairs_changed or quote_field_changes):
+                state.rendered = rendered
+            # New pairs and traded/disabled moves are detected against the pairs file as last written
+            if pairs_changed:
+                state.traded_pairs = current_traded_pairs
+                state.disabled_pairs = current_disabled_pairs
+            if pairs_changed and self.is_writer:
+                if self.watchlist_builder is not None:
+                    prefix = self.fetcher.tradingview_prefix(venue)
+                    self.watchlist_builder.submit(state.label, (f"{prefix}:{split_key(pair)[1].replace('-', '')}" for pair in rendered[0]))
+
+            # With other instances running, only announce the changes no other instance has announced yet
+            # The local state above still follows every detected change
+            announced_new_pairs, announced_to_traded, announced_to_disabled, announced_field_changes = self.claim_changes(
+                new_pairs, removed_pairs, current_traded_pairs, moved_to_traded, moved_to_disabled, quote_field_changes)
+
+            # Record new pairs with the time they were found in the event store
+            # This helps in keeping track of when new pairs are introduced
+            if announced_new_pairs:
+                events.extend(make_event(scan_time, EVENT_NEW_PAIR, pair) for pair in sorted(announced_new_pairs))
+                lines = []
+                for pair in sorted(announced_new_pairs):
+                    if pair in current_traded_pairs:
+                        lines.append((f"{mentionrole} [Enabled] {pair} has been detected.{self.product_link(pair)}", pair if enrich else None))
+                    else:
+                        lines.append((f"{mentionrole} [Disabled] {pair} has been detected.", pair if enrich else None))
+                notifications.append((quote, lines))
+
+            # Record and notify about pairs moving between traded and disabled
+            # This records the pairs that have been enabled or disabled and notifies via Discord
+            if announced_to_traded or announced_to_disabled:
+                lines = []
+                for pair in sorted(announced_to_traded):
+                    events.append(make_event(scan_time, EVENT_ENABLED, pair))
+                    lines.append((f"{mentionrole} {pair} trading has been enabled.{self.product_link(pair)}", pair if enrich else None))
+                for pair in sorted(announced_to_disabled):
+                    events.append(make_event(scan_time, EVENT_DISABLED, pair))
+                    lines.append((f"{mentionrole} {pair} trading has been disabled.", None))
+                notifications.append((quote, lines))
+
+            # Record and notify about changes in specified fields
+            # This section detects changes in fields like 'post_only', 'limit_only', etc., and notifies via Discord
+            if announced_field_changes:
+                lines = []
+                for pair_id, changes in announced_field_changes.items():
+                    for field, value in changes.items():
+                        if field == 'status_message' and value == "":
+                            continue  # Skip notification for blank status_message
+                        events.append(make_event(scan_time, EVENT_FIELD_CHANGE, pair_id, field, value))
+                        if field in ['post_only', 'limit_only', 'cancel_only']:
+                            lines.append((f"{mentionrole} {pair_id} {field.replace('_', ' ')} has been {'enabled' if value == 'true' else 'disabled'}.{self.product_link(pair_id)}", None))
+                        elif field == 'status':
+                            if value == 'online':
+                                lines.append((f"{mentionrole} {pair_id} is now online{self.product_link(pair_id)}", None))
+                            else:
+                                lines.append((f"{mentionrole} {pair_id} is now {value}.", None))
+                        elif field == 'status_message':
+                            lines.append((f"{mentionrole} {pair_id} status updated: {value}.{self.product_link(pair_id)}", None))
+                        elif field == 'trading_disabled':
+                            if value.lower() == 'true':
+                                lines.append((f"{mentionrole} {pair_id} trading has been disabled.", None))
+                            else:
+                                lines.append((f"{mentionrole} {pair_id} trading has been enabled.{self.product_link(pair_id)}", None))
+                        elif field == 'auction_mode':
+                            lines.append((f"{mentionrole} {pair_id} auction mode has {'started' if value == 'true' else 'ended'}.{self.product_link(pair_id)}", None))
+
+                if lines:  # Only send notification if there's content
+                    notifications.append((quote, lines))
+
+            all_new_pairs |= new_pairs
+            all_moved_to_traded |= moved_to_traded
+            all_moved_to_disabled |= moved_to_disabled
+
+        started = time.perf_counter()
+        self.events.record(events)
+        self.add_stage_time("write", started)
+        for event in events:
+            CHANGES.inc(event[1])
+        if field_changes:
+            self.fields_status = current_fields_status
+
+        # A new writer records every value it knows that the shared state has never seen, so an instance starting
+        # later with no local state finds them already claimed instead of announcing them all again
+        if self.is_writer and self.seed_pending:
+            self.seed_shared_state(watched_pairs, current_fields_status)
+
+        # Print results only if there are new pairs or changes in pair status or fields
+        new_pairs, moved_to_traded, moved_to_disabled = all_new_pairs, all_moved_to_traded, all_moved_to_disabled
+        elapsed_time = (time.time() - start_time) * 1000  # Calculate elapsed time in milliseconds
+        if new_pairs or moved_to_traded or moved_to_disabled or field_changes:
+            if new_pairs:
+                log("New pairs found:")
+                for pair in new_pairs:
+                    log(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair}")
             if moved_to_traded:
+                log("Pairs Enabled:")
                 for pair in moved_to_traded:
-                    log = f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair} has been enabled\n"
-                    file.write(log)
-                    content += f"{mentionrole} {pair} trading has been enabled.\n<https://www.coinbase.com/advanced-trade/spot/{pair}>\n"
+                    log(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair}")
             if moved_to_disabled:
+                log("Pairs Disabled:")
                 for pair in moved_to_disabled:
-                    log = f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair} has been disabled\n"
-                    file.write(log)
-                    content += f"{mentionrole} {pair} trading has been disabled.\n"
-        if content:
-            send_discord_notification(content)
-        print("activations.txt has been updated with changes in pair status.")
-    
-    # Log and notify about changes in specified fields
-    # This section detects changes in fields like 'post_only', 'limit_only', etc., and notifies via Discord
-    field_changes_file_path = os.path.join(script_dir, "field_changes.txt")
-    fields_status_file_path = os.path.join(script_dir, "fields_status.txt")
-    if field_changes:
-        content = ""
-        with open(field_changes_file_path, "a") as file:
-            for pair_id, changes in field_changes.items():
-                for field, value in changes.items():
-                    if field == 'status_message' and value == "":
-                        continue  # Skip notification for blank status_message
-                    log = f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair_id} {field} changed to {value}\n"
-                    file.write(log)
-                    if field in ['post_only', 'limit_only', 'cancel_only']:
-                        content += f"{mentionrole} {pair_id} {field.replace('_', ' ')} has been {'enabled' if value == 'true' else 'disabled'}.\n<https://www.coinbase.com/advanced-trade/spot/{pair_id}>\n"
-                    elif field == 'status':
-                        if value == 'online':
-                            content += f"{mentionrole} {pair_id} is now online\n<https://www.coinbase.com/advanced-trade/spot/{pair_id}>\n"
-                        else:
-                            content += f"{mentionrole} {pair_id} is now {value}.\n"
-                    elif field == 'status_message':
-                        content += f"{mentionrole} {pair_id} status updated: {value}.\n<https://www.coinbase.com/advanced-trade/spot/{pair_id}>\n"
-                    elif field == 'trading_disabled':
-                        if value.lower() == 'true':
-                            content += f"{mentionrole} {pair_id} trading has been disabled.\n"
-                        else:
-                            content += f"{mentionrole} {pair_id} trading has been enabled.\n<https://www.coinbase.com/advanced-trade/spot/{pair_id}>\n"
-                    elif field == 'auction_mode':
-                        content += f"{mentionrole} {pair_id} auction mode has {'started' if value == 'true' else 'ended'}.\n<https://www.coinbase.com/advanced-trade/spot/{pair_id}>\n"
-
-        if content:  # Only send notification if there's content
-            send_discord_notification(content)
-            print("field_changes.txt has been updated with changes in specified fields.")
-            print("Discord notification sent successfully.")
+                    log(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair}")
+            if field_changes:
+                log("Field changes:")
+                for pair_id, changes in field_changes.items():
+                    for field, value in changes.items():
+                        log(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair_id} {field} changed to {value}",
+                            pair=pair_id, field=field, value=value)
+            changed = True
+        else:
+            log(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {elapsed_time:.2f} ms - No new pairs found this scan.",
+                elapsed_ms=round(elapsed_time, 2), fast_path=False)
+            changed = False
 
-        # Update the fields_status file with the current statuses to prevent repeated notifications
-        # Alphabetize by pair_id for consistency
-        sorted_pairs = sorted(current_fields_status.items())
-        with open(fields_status_file_path, "w") as file:
-            for pair_id, statuses in sorted_pairs:
-                file.write(f"{pair_id}:{','.join(f'{k}={v}' for k, v in statuses.items())}\n")
-        print("fields_status.txt has been updated.")
-
-    # Print results only if there are new pairs or changes in pair status or fields
-    elapsed_time = (time.time() - start_time) * 1000  # Calculate elapsed time in milliseconds
-    if new_pairs or moved_to_traded or moved_to_disabled or field_changes:
-        if new_pairs:
-            print("New pairs found:")
-            for pair in new_pairs:
-                print(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair}")
-        if moved_to_traded:
-            print("Pairs Enabled:")
-            for pair in moved_to_traded:
-                print(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair}")
-        if moved_to_disabled:
-            print("Pairs Disabled:")
-            for pair in moved_to_disabled:
-                print(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair}")
-        if field_changes:
-            print("Field changes:")
-            for pair_id, changes in field_changes.items():
-                for field, value in changes.items():
-                    print(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {pair_id} {field} changed to {value}")
-    else:
-        print(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - {elapsed_time:.2f} ms - No new pairs found this scan.")
+        if self.archive is not None and self.is_writer:
+            self.archive.record(scan_time, products)
+
+        self.products = {product['id']: product for product in products}
+        return changed, notifications
 
-# Main loop: The script continuously runs and fetches USD pairs from Coinbase Pro API every 2 seconds
+# Scanner used by fetch_usd_pairs(), created on first use so importing this module has no side effects
+scanner = None
+
+# Function to fetch all trading pairs from Coinbase Pro API and process them
+# Despite the name it watches every quote currency in QUOTE_CURRENCIES (USD by default)
+# Kept for callers that drive the scan themselves; the state lives in a single long-lived PairScanner
+def fetch_usd_pairs():
+    global scanner
+    if scanner is None:
+        scanner = PairScanner()
+    return scanner.scan()
+
+# Main loop: The script continuously fetches the watched pairs from Coinbase Pro API on a fixed 2 second cadence
+# The scheduler switches to a faster burst interval for a while after a change and backs off on errors
+# In stream mode the WebSocket status channel drives detection and REST is only polled to reconcile
 if __name__ == "__main__":
-    fetch_usd_pairs()  # Ensure the files are created/updated on the first run
-    while True:
-        fetch_usd_pairs()
-        time.sleep(2)  # Wait for 2 seconds before running again
+    watchlist_builder = None
+    if os.getenv('BUILD_WATCHLIST', 'false').lower() == 'true':
+        from tradingview_watchlist_builder import WatchlistBuilder
+        watchlist_builder = WatchlistBuilder()
+        watchlist_builder.start()
+    venues = make_adapters(venue.strip() for venue in os.getenv('VENUES', 'coinbase').split(',') if venue.strip())
+    shared_state = None
+    if os.getenv('SHARED_STATE'):
+        shared_state = SqliteSharedState(os.getenv('SHARED_STATE'), os.getenv('INSTANCE_ID'),
+                                         shared_storage=os.getenv('SHARED_STATE_NETWORK', 'false').lower() == 'true')
+    enrichment_deadline = float(os.getenv('ENRICHMENT_DEADLINE', 1))
+    enricher = Enricher(deadline=enrichment_deadline) if enrichment_deadline > 0 else None
+    archive = None
+    if os.getenv('ARCHIVE'):
+        archive = SnapshotArchive(os.path.join(script_dir, os.getenv('ARCHIVE')),
+                                  retention_days=float(os.getenv('ARCHIVE_RETENTION_DAYS', 365)))
+    scanner = PairScanner(watchlist_builder=watchlist_builder, venues=venues, shared_state=shared_state,
+                          lease_ttl=float(os.getenv('WRITER_LEASE_TTL', 10)), enricher=enricher, archive=archive)
+    if os.getenv('METRICS_PORT'):
+        start_metrics_server(int(os.getenv('METRICS_PORT')), os.getenv('METRICS_HOST', '127.0.0.1'))
+    if os.getenv('INGEST_MODE', 'poll') == 'stream':
+        runner = StatusStream(scanner, reconcile_interval=float(os.getenv('RECONCILE_INTERVAL', 60)))
+    else:
+        runner = ScanScheduler(
+            scanner.scan,
+            interval=float(os.getenv('SCAN_INTERVAL', 2)),
+            burst_interval=float(os.getenv('BURST_INTERVAL', 1)),
+            burst_duration=float(os.getenv('BURST_DURATION', 300)),
+            requests_per_second=float(os.getenv('REQUESTS_PER_SECOND', 3)),
+            phase=int(os.getenv('INSTANCE_INDEX', 0)) / int(os.getenv('INSTANCE_COUNT')) if os.getenv('INSTANCE_COUNT') else None,
+        )
+    try:
+        asyncio.run(runner.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Persist anything the dispatchers have not delivered yet so it is sent after a restart
+        scanner.close_delivery()
+        for notifier in notifiers.values():
+            notifier.stop()
+        if watchlist_builder is not None:
+            watchlist_builder.stop()
+        scanner.events.close()
+        if enricher is not None:
+            enricher.close()
+        if archive is not None:
+            archive.close()
+        if shared_state is not None:
+            shared_state.release_lease()
+            shared_state.close()
@@ -0,0 +1,12 @@
+import os
+
+# Function to replace a file's contents atomically
+# The content is written to a temporary file next to the target and then renamed over it,
+# so a crash mid-write leaves either the old file or the new one, never a truncated one
+def write_file_atomic(path, content):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
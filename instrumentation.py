@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import bisect
+import threading
+import http.server
+from datetime import datetime
+
+# Lightweight metrics and logging for the scanner
+# Counters, gauges and histograms are plain in-process objects (an increment or a bisect per observation),
+# cheap enough to stay on at a 1 second cadence. They can be scraped in Prometheus text format from an optional
+# local HTTP endpoint (METRICS_PORT), and LOG_FORMAT=json switches log() to one JSON object per line.
+
+# Default histogram buckets in seconds, from sub-millisecond stages up to slow network calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Function to log a message
+# In text mode this is a plain print, exactly as before; in JSON mode the message and any extra fields
+# are written as a single JSON line with a timestamp and level
+# LOG_FORMAT is read on every call so a value loaded from .env after import still applies
+def log(message, level="info", **fields):
+    if os.getenv('LOG_FORMAT', 'text').lower() == "json":
+        record = {"time": datetime.now().isoformat(timespec="milliseconds"), "level": level, "msg": message}
+        record.update(fields)
+        sys.stdout.write(json.dumps(record, default=str) + "\n")
+        sys.stdout.flush()
+    else:
+        print(message)
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        values = self.values if self.values or self.labels else {(): 0}
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+# A gauge is either set directly or reads its value from a function at scrape time
+class Gauge:
+    def __init__(self, name, help, function=None):
+        self.name = name
+        self.help = help
+        self.function = function
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        value = self.function() if self.function is not None else self.value
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {0 if value is None else value}"]
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # Per label set: [bucket counts..., +Inf count], sum
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {label_values: (list(counts), total) for label_values, (counts, total) in self.series.items()}
+        for label_values, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), label_values + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.metrics.get(name) or self.add(Counter(name, help, labels))
+
+    def gauge(self, name, help, function=None):
+        gauge = self.metrics.get(name)
+        if gauge is None:
+            gauge = self.add(Gauge(name, help, function))
+        elif function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.metrics.get(name) or self.add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Metrics shared by the scanner modules
+STAGE_SECONDS = REGISTRY.histogram("pair_scanner_stage_seconds", "Time spent in each scan stage.", labels=("stage",))
+SCANS = REGISTRY.counter("pair_scanner_scans_total", "Scans run.")
+FAST_PATH = REGISTRY.counter("pair_scanner_fast_path_total", "Scans that ended early because the payload was unchanged.")
+CHANGES = REGISTRY.counter("pair_scanner_changes_total", "Changes detected, by kind.", labels=("kind",))
+ERRORS = REGISTRY.counter("pair_scanner_errors_total", "Scans that failed.")
+VENUE_ERRORS = REGISTRY.counter("pair_scanner_venue_errors_total", "Failed or timed out product requests, by venue.", labels=("venue",))
+RATE_LIMITED = REGISTRY.counter("pair_scanner_rate_limited_total", "HTTP 429 responses, by source.", labels=("source",))
+DETECTION_LAG = REGISTRY.gauge("pair_scanner_detection_lag_seconds",
+                               "Upper bound on how long the last detected change could have gone unseen: time between the fetch that found it and the previous one.")
+NOTIFICATIONS_SENT = REGISTRY.counter("pair_scanner_notifications_sent_total", "Discord messages delivered.")
+NOTIFICATION_DELIVERY_SECONDS = REGISTRY.histogram("pair_scanner_notification_delivery_seconds",
+                                                   "Time from a notification being queued to being delivered to Discord.")
+ENRICHMENT_CACHE = REGISTRY.counter("pair_scanner_enrichment_cache_total", "Enrichment lookups, by cache result (hit, miss, or throttled by the request budget).", labels=("result",))
+ENRICHMENT_TIMEOUTS = REGISTRY.counter("pair_scanner_enrichment_timeouts_total", "Notifications sent without some details because the enrichment deadline passed.")
+
+# Serve REGISTRY in Prometheus text format on http://host:port/metrics from a background thread
+def start_metrics_server(port, host="127.0.0.1", registry=REGISTRY):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    log(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
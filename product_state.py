@@ -0,0 +1,169 @@
+from array import array
+
+# NumPy is optional: when it is installed the diff runs as vectorised XOR/compare over the columns,
+# otherwise the same comparison runs as a plain loop over the array-backed columns
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Boolean product fields, packed into one bitmask per product (bit 0 = post_only, bit 1 = limit_only, ...)
+FLAG_FIELDS = ('post_only', 'limit_only', 'cancel_only', 'trading_disabled', 'auction_mode')
+FLAG_BITS = {field: 1 << bit for bit, field in enumerate(FLAG_FIELDS)}
+
+# Every tracked field, in the order they are written to fields_status.txt and reported as changes
+STATUS_FIELDS = ('post_only', 'limit_only', 'cancel_only', 'status', 'status_message', 'trading_disabled', 'auction_mode')
+
+# Maps each distinct string to a small integer code and back
+# Products share a handful of status values and status messages, so each is stored once
+class InternTable:
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+# Stable row number per product id, plus the intern tables for status and status_message
+# Shared by every ProductTable built by a scanner so rows and codes line up between scans
+class ProductIndex:
+    def __init__(self):
+        self.rows = {}
+        self.pair_ids = []
+        self.statuses = InternTable()
+        self.messages = InternTable()
+
+    def row(self, pair_id):
+        row = self.rows.get(pair_id)
+        if row is None:
+            row = len(self.pair_ids)
+            self.rows[pair_id] = row
+            self.pair_ids.append(pair_id)
+        return row
+
+# Column-oriented snapshot of product state
+# Each product occupies the same row in every table built from the same index, so comparing two snapshots is an
+# XOR of the flag columns and an equality check of the code columns; only rows that differ are decoded back to strings
+class ProductTable:
+    def __init__(self, index):
+        self.index = index
+        self.present = array('B')
+        self.flags = array('B')
+        self.status = array('I')
+        self.message = array('I')
+
+    def __len__(self):
+        return len(self.present)
+
+    # Grow every column to `size` rows; new rows are marked as not present
+    def resize(self, size):
+        missing = size - len(self.present)
+        if missing > 0:
+            self.present.extend(bytes(missing))
+            self.flags.extend(bytes(missing))
+            self.status.extend([0] * missing)
+            self.message.extend([0] * missing)
+
+    def set(self, pair_id, flags, status, message):
+        row = self.index.row(pair_id)
+        if row >= len(self.present):
+            self.resize(len(self.index.pair_ids))
+        self.present[row] = 1
+        self.flags[row] = flags
+        self.status[row] = status
+        self.message[row] = message
+
+    # Add product records as returned by the API (booleans and strings)
+    # This runs once per product per scan, so the bitmask is built inline and the columns are grown once up front
+    def add_products(self, products):
+        index = self.index
+        row_of = index.row
+        status_code = index.statuses.code
+        message_code = index.messages.code
+        rows = [row_of(product['id']) for product in products]
+        self.resize(len(index.pair_ids))
+        present, flag_column, status_column, message_column = self.present, self.flags, self.status, self.message
+        for row, product in zip(rows, products):
+            present[row] = 1
+            flag_column[row] = ((1 if product['post_only'] else 0) | (2 if product['limit_only'] else 0)
+                                | (4 if product['cancel_only'] else 0) | (8 if product['trading_disabled'] else 0)
+                                | (16 if product['auction_mode'] else 0))
+            status_column[row] = status_code(str(product['status']))
+            message_column[row] = message_code(str(product['status_message']))
+
+    # Add a product from its string form as stored in fields_status.txt
+    def add_statuses(self, pair_id, statuses):
+        flags = 0
+        for field, bit in FLAG_BITS.items():
+            if statuses.get(field) == 'True':
+                flags |= bit
+        self.set(pair_id, flags, self.index.statuses.code(statuses.get('status', '')),
+                 self.index.messages.code(statuses.get('status_message', '')))
+
+    # Decode one row back to the string form used in fields_status.txt and notifications
+    def statuses(self, row):
+        flags = self.flags[row]
+        return {
+            'post_only': str(bool(flags & FLAG_BITS['post_only'])),
+            'limit_only': str(bool(flags & FLAG_BITS['limit_only'])),
+            'cancel_only': str(bool(flags & FLAG_BITS['cancel_only'])),
+            'status': self.index.statuses.values[self.status[row]],
+            'status_message': self.index.messages.values[self.message[row]],
+            'trading_disabled': str(bool(flags & FLAG_BITS['trading_disabled'])),
+            'auction_mode': str(bool(flags & FLAG_BITS['auction_mode'])),
+        }
+
+    # All present products as {pair_id: statuses}, sorted by pair id
+    def to_fields_status(self):
+        pair_ids = self.index.pair_ids
+        return {pair_ids[row]: self.statuses(row) for row in sorted(range(len(self.present)), key=pair_ids.__getitem__) if self.present[row]}
+
+    # Rows present in this table that are new or differ from `previous`
+    def changed_rows(self, previous):
+        size = len(self.present)
+        previous.resize(size)
+        if size == 0:
+            return []
+        if np is not None:
+            present = np.frombuffer(self.present, dtype=np.uint8)
+            previous_present = np.frombuffer(previous.present, dtype=np.uint8, count=size)
+            changed = np.frombuffer(self.flags, dtype=np.uint8) ^ np.frombuffer(previous.flags, dtype=np.uint8, count=size)
+            changed = changed != 0
+            changed |= np.frombuffer(self.status, dtype=np.uint32) != np.frombuffer(previous.status, dtype=np.uint32, count=size)
+            changed |= np.frombuffer(self.message, dtype=np.uint32) != np.frombuffer(previous.message, dtype=np.uint32, count=size)
+            changed |= previous_present == 0
+            changed &= present == 1
+            return np.flatnonzero(changed).tolist()
+        return [row for row, (present, previous_present, flags, previous_flags, status, previous_status, message, previous_message)
+                in enumerate(zip(self.present, previous.present, self.flags, previous.flags,
+                                 self.status, previous.status, self.message, previous.message))
+                if present and (not previous_present or flags ^ previous_flags or status != previous_status or message != previous_message)]
+
+    # Field changes against `previous` as {pair_id: {field: new value}}, decoding only the rows that changed
+    # A product that was not present before reports every field, as it always has
+    def field_changes(self, previous):
+        changes = {}
+        pair_ids = self.index.pair_ids
+        for row in self.changed_rows(previous):
+            statuses = self.statuses(row)
+            if not previous.present[row]:
+                changes[pair_ids[row]] = statuses
+                continue
+            flipped = self.flags[row] ^ previous.flags[row]
+            row_changes = {}
+            for field in STATUS_FIELDS:
+                if field in FLAG_BITS:
+                    if flipped & FLAG_BITS[field]:
+                        row_changes[field] = statuses[field]
+                elif field == 'status':
+                    if self.status[row] != previous.status[row]:
+                        row_changes[field] = statuses[field]
+                elif self.message[row] != previous.message[row]:
+                    row_changes[field] = statuses[field]
+            changes[pair_ids[row]] = row_changes
+        return changes
@@ -0,0 +1,182 @@
+import asyncio
+import random
+import time
+from datetime import datetime
+from instrumentation import log, REGISTRY
+
+# Outcomes a scan function returns, used by the scheduler to pick the next interval
+SCAN_CHANGED = "changed"
+SCAN_UNCHANGED = "unchanged"
+SCAN_ERROR = "error"
+SCAN_RATE_LIMITED = "rate_limited"
+# Nothing was requested because every source is backing off after a failure (or still busy with an earlier request)
+SCAN_SKIPPED = "skipped"
+
+# Token bucket limiting how many requests we make against the exchange
+# Tokens refill continuously at `rate` per second up to `capacity`, so short bursts are allowed
+# but the long-run request rate never exceeds the public rate limit
+class RequestBudget:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Take one token without waiting; returns False when the budget is exhausted
+    def try_acquire(self):
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    # Wait until a token is available and take it
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Fixed-cadence scan scheduler
+# Scans are started on a grid measured start-to-start, so the period does not drift by the scan time.
+# A scan that overruns its slot skips the missed ticks instead of running late back-to-back.
+# After a change the scheduler polls at burst_interval for burst_duration seconds, because listings arrive in clusters,
+# and after errors or rate-limit responses it backs off exponentially with jitter.
+# With a phase (0 <= phase < 1) the grid is pinned to wall-clock time at phase * interval past every multiple of the
+# interval, so N instances with phases 0, 1/N, 2/N, ... take turns and together sample every interval / N seconds.
+class ScanScheduler:
+    def __init__(self, scan, interval=2.0, burst_interval=1.0, burst_duration=300.0,
+                 backoff_base=2.0, max_backoff=60.0, requests_per_second=3.0, report_interval=300.0, phase=None):
+        self.scan = scan
+        self.interval = interval
+        self.burst_interval = burst_interval
+        self.burst_duration = burst_duration
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.budget = RequestBudget(requests_per_second)
+        self.report_interval = report_interval
+        self.phase = phase
+
+        self.burst_until = 0.0
+        self.consecutive_failures = 0
+        self.stopped = False
+
+        # Metrics: scans run, ticks skipped because a scan overran, and the achieved start-to-start period
+        self.scan_count = 0
+        self.missed_ticks = 0
+        self.error_count = 0
+        self.rate_limited_count = 0
+        self.last_start = None
+        self.last_period = None
+        self.average_period = None
+        self.max_period = None
+
+        # The same numbers, exposed on the metrics endpoint
+        REGISTRY.gauge("pair_scanner_achieved_period_seconds", "Average start-to-start scan period.", function=lambda: self.average_period)
+        REGISTRY.gauge("pair_scanner_last_period_seconds", "Start-to-start period of the last scan.", function=lambda: self.last_period)
+        REGISTRY.gauge("pair_scanner_missed_ticks", "Scheduled scans skipped because a scan overran its slot.", function=lambda: self.missed_ticks)
+        REGISTRY.gauge("pair_scanner_burst_active", "1 while burst polling is active.", function=lambda: int(time.monotonic() < self.burst_until))
+
+    # Interval currently in effect: the burst interval while a burst is active, the normal one otherwise
+    def current_interval(self, now):
+        return self.burst_interval if now < self.burst_until else self.interval
+
+    # Exponential backoff with full jitter, so several instances recovering together don't retry in lockstep
+    def backoff_delay(self):
+        delay = min(self.max_backoff, self.backoff_base * 2 ** (self.consecutive_failures - 1))
+        return random.uniform(delay / 2, delay)
+
+    # First slot of the phase grid for `interval` that is at least half an interval after `now` (a loop time)
+    # The margin keeps a scan that woke a little early from being scheduled again right away
+    def aligned_tick(self, now, interval):
+        wall = time.time() + now - asyncio.get_running_loop().time()
+        offset = interval - (wall - self.phase * interval) % interval
+        if offset < interval / 2:
+            offset += interval
+        return now + offset
+
+    def record_start(self, start):
+        if self.last_start is not None:
+            period = start - self.last_start
+            self.last_period = period
+            self.max_period = period if self.max_period is None else max(self.max_period, period)
+            # Exponentially weighted average so the metric follows recent behaviour
+            self.average_period = period if self.average_period is None else self.average_period * 0.9 + period * 0.1
+        self.last_start = start
+        self.scan_count += 1
+
+    def metrics(self):
+        return {
+            "scans": self.scan_count,
+            "missed_ticks": self.missed_ticks,
+            "errors": self.error_count,
+            "rate_limited": self.rate_limited_count,
+            "last_period": self.last_period,
+            "average_period": self.average_period,
+            "max_period": self.max_period,
+            "burst_active": time.monotonic() < self.burst_until,
+        }
+
+    def report(self):
+        m = self.metrics()
+        average = f"{m['average_period']:.3f} s" if m['average_period'] is not None else "n/a"
+        log(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - Scheduler: {m['scans']} scans, average period {average}, "
+            f"{m['missed_ticks']} missed ticks, {m['errors']} errors, {m['rate_limited']} rate limited, "
+            f"burst {'on' if m['burst_active'] else 'off'}", **m)
+
+    def stop(self):
+        self.stopped = True
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() if self.phase is None else self.aligned_tick(loop.time(), self.interval)
+        next_report = next_tick + self.report_interval
+        while not self.stopped:
+            # Sleep until the next slot on the grid
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.budget.acquire()
+
+            start = loop.time()
+            self.record_start(start)
+            try:
+                # The scan does blocking network I/O, so it runs in a worker thread to keep the loop responsive
+                result = await asyncio.to_thread(self.scan)
+            except Exception as e:
+                log(f"Error during scan: {e}", level="error")
+                result = SCAN_ERROR
+            now = loop.time()
+
+            if result in (SCAN_ERROR, SCAN_RATE_LIMITED):
+                if result == SCAN_ERROR:
+                    self.error_count += 1
+                else:
+                    self.rate_limited_count += 1
+                self.consecutive_failures += 1
+                # Restart the grid after the backoff instead of trying to catch up on skipped ticks
+                next_tick = now + self.backoff_delay()
+                if self.phase is not None:
+                    next_tick = self.aligned_tick(next_tick, self.interval)
+            else:
+                # A skipped scan made no request, so it says nothing about whether the failures are over
+                if result != SCAN_SKIPPED:
+                    self.consecutive_failures = 0
+                if result == SCAN_CHANGED:
+                    if now >= self.burst_until:
+                        log(f"Change detected, polling every {self.burst_interval} s for the next {self.burst_duration:.0f} s.")
+                    self.burst_until = now + self.burst_duration
+                interval = self.current_interval(now)
+                next_tick = start + interval if self.phase is None else self.aligned_tick(start, interval)
+                # Skip any ticks the scan overran instead of firing them late back-to-back
+                if next_tick <= now:
+                    skipped = int((now - next_tick) // interval) + 1
+                    self.missed_ticks += skipped
+                    next_tick += skipped * interval
+
+            if now >= next_report:
+                self.report()
+                next_report = now + self.report_interval
@@ -0,0 +1,117 @@
+import os
+import time
+import socket
+import sqlite3
+import threading
+import contextlib
+
+# State shared by several scanner instances running phase-offset schedules
+# Every detected change is a transition of one (pair, field) to a new value. Announcing it is a compare-and-swap on
+# the shared copy of that value: only the instance that actually moves it to the new value wins, so each change is
+# notified exactly once, and an instance that is behind finds the value already there and stays quiet.
+# Derived files are written by a single instance at a time, the holder of a short writer lease, so instances never
+# overwrite each other's fields_status.txt or pairs files.
+#
+# Any object with claim(), seed() and acquire_lease() can be passed to PairScanner as its shared state.
+# SqliteSharedState is meant for processes on one host. It uses WAL mode there, which needs shared memory and so
+# breaks down on network filesystems: two hosts could both win a claim or both hold the lease. With shared_storage
+# it uses a rollback journal instead, which only relies on the filesystem's byte-range locks; that works on
+# filesystems whose locking SQLite supports (e.g. NFSv4 with working locks), and nothing can make it safe on one
+# that does not. Every write runs in a BEGIN IMMEDIATE transaction, so a claim reads and updates under one lock.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS field_state (
+    pair TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    instance TEXT,
+    updated REAL,
+    PRIMARY KEY (pair, field)
+);
+CREATE TABLE IF NOT EXISTS lease (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+def default_instance_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+class SqliteSharedState:
+    def __init__(self, path, instance_id=None, shared_storage=False):
+        self.path = path
+        self.instance_id = instance_id or default_instance_id()
+        # Transactions are opened explicitly in transaction()
+        self.connection = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        if shared_storage:
+            self.connection.execute("PRAGMA journal_mode=DELETE")
+            self.connection.execute("PRAGMA synchronous=FULL")
+        else:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    # Write transaction that takes the database's write lock up front
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    # Claim transitions, given as (pair, field, new value) tuples, in one transaction
+    # Returns the set of transitions this instance won: those whose shared value was not already the new value
+    def claim(self, transitions):
+        won = set()
+        if not transitions:
+            return won
+        now = time.time()
+        with self.transaction():
+            for transition in transitions:
+                pair, field, value = transition
+                cursor = self.connection.execute(
+                    "UPDATE field_state SET value = ?, version = version + 1, instance = ?, updated = ? "
+                    "WHERE pair = ? AND field = ? AND value IS NOT ?", (value, self.instance_id, now, pair, field, value))
+                if cursor.rowcount == 0:
+                    cursor = self.connection.execute(
+                        "INSERT OR IGNORE INTO field_state (pair, field, value, version, instance, updated) VALUES (?, ?, ?, 1, ?, ?)",
+                        (pair, field, value, self.instance_id, now))
+                if cursor.rowcount == 1:
+                    won.add(transition)
+        return won
+
+    # Record values for (pair, field, value) rows that have never been claimed, without claiming them
+    # The writer seeds every product it knows when it takes over, so an instance that starts late or with empty
+    # local state finds all current values already present and announces nothing that is old news
+    def seed(self, rows):
+        now = time.time()
+        with self.transaction():
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO field_state (pair, field, value, version, instance, updated) VALUES (?, ?, ?, 0, ?, ?)",
+                ((pair, field, value, self.instance_id, now) for pair, field, value in rows))
+
+    # Take or renew the named lease for ttl seconds; returns True while this instance holds it
+    def acquire_lease(self, ttl, name="writer"):
+        now = time.time()
+        with self.transaction():
+            self.connection.execute(
+                "INSERT INTO lease (name, holder, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires "
+                "WHERE lease.holder = excluded.holder OR lease.expires < ?", (name, self.instance_id, now + ttl, now))
+            holder, = self.connection.execute("SELECT holder FROM lease WHERE name = ?", (name,)).fetchone()
+        return holder == self.instance_id
+
+    # Give the lease up so another instance can take over right away, e.g. on shutdown
+    def release_lease(self, name="writer"):
+        with self.transaction():
+            self.connection.execute("DELETE FROM lease WHERE name = ? AND holder = ?", (name, self.instance_id))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import zlib
+import queue
+import sqlite3
+import argparse
+import threading
+import time
+from datetime import datetime
+from instrumentation import log
+
+# Archive of every product state the scanner has seen, for auditing alerts and backtesting detection rules
+# Frames are stored in SQLite: a keyframe holds the full {product id: record} state, and each processed scan whose
+# products differ from the previous one adds a delta holding only the records that changed or disappeared. Both are
+# zlib-compressed JSON. A scan that changes nothing adds nothing, since the state it saw is the last frame's.
+# A new keyframe starts every keyframe_interval seconds or after max_deltas deltas, so the state at any time is
+# rebuilt from the latest keyframe before it plus at most max_deltas small deltas, found through the ts indexes.
+#
+# Retention: frames older than retention_days are deleted, keeping the keyframe the oldest retained state needs.
+# Compaction: past compact_after_days keyframes are thinned to one per compacted_keyframe_interval by rewriting the
+# others as deltas, which is where most of the space goes. A keyframe is only rewritten while its group stays within
+# max_deltas deltas, so lookups in compacted history also replay at most max_deltas of them; a busy day keeps more
+# keyframes than a quiet one. With hourly keyframes of a ~700 product payload (about 15 kB compressed) thinned to
+# daily ones after 30 days, a year of 1-second scans stays well under 100 MB.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    keyframe INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS frames_keyframe_ts ON frames (keyframe, ts);
+CREATE INDEX IF NOT EXISTS frames_keyframes ON frames (ts) WHERE keyframe = id;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def connect(path):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    # Must be set before the tables exist for deleted frames to be handed back to the filesystem
+    connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+def encode(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':'), sort_keys=True).encode(), 9)
+
+def decode(data):
+    return json.loads(zlib.decompress(data))
+
+# Delta turning state `before` into state `after`; both are {product id: record}
+def make_delta(before, after):
+    return {
+        "set": {product_id: record for product_id, record in after.items() if before.get(product_id) != record},
+        "del": [product_id for product_id in before if product_id not in after],
+    }
+
+def apply_delta(state, delta):
+    state.update(delta["set"])
+    for product_id in delta["del"]:
+        state.pop(product_id, None)
+
+# Full state of one keyframe's group up to `until` (a unix timestamp, inclusive), or to its last frame
+def replay(connection, keyframe_id, until=None):
+    sql = "SELECT id, data FROM frames WHERE keyframe = ?"
+    params = [keyframe_id]
+    if until is not None:
+        sql += " AND ts <= ?"
+        params.append(until)
+    state = None
+    for frame_id, data in connection.execute(sql + " ORDER BY ts, id", params):
+        if frame_id == keyframe_id:
+            state = decode(data)
+        else:
+            apply_delta(state, decode(data))
+    return state
+
+# Product state as of `ts` as {product id: record}, or None when the archive has nothing that old
+# Without ts, the latest archived state
+def state_at(connection, ts=None):
+    sql = "SELECT id FROM frames WHERE keyframe = id"
+    params = []
+    if ts is not None:
+        sql += " AND ts <= ?"
+        params.append(ts)
+    row = connection.execute(sql + " ORDER BY ts DESC LIMIT 1", params).fetchone()
+    if row is None:
+        return None
+    return replay(connection, row[0], ts)
+
+# Appends frames from a background thread, like the event store, so archiving never adds latency to a scan
+class SnapshotArchive:
+    def __init__(self, path, keyframe_interval=3600.0, max_deltas=500, retention_days=365.0, compact_after_days=30.0,
+                 compacted_keyframe_interval=86400.0, maintenance_interval=86400.0):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.max_deltas = max_deltas
+        self.retention_days = retention_days
+        self.compact_after_days = compact_after_days
+        self.compacted_keyframe_interval = compacted_keyframe_interval
+        self.maintenance_interval = maintenance_interval
+        self.connection = connect(path)
+
+        # Last archived state and the keyframe it belongs to, loaded lazily by the worker
+        self.state = None
+        self.keyframe_id = None
+        self.keyframe_ts = None
+        self.deltas = 0
+        self.last_maintenance = 0.0
+
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self.run, name="snapshot-archive", daemon=True)
+        self.worker.start()
+
+    # Queue the products one scan processed (a list of product records) for archiving
+    def record(self, ts, products):
+        self.queue.put((ts, products))
+
+    # Reload the last archived state from the database before the next frame, for when another process has been
+    # writing to the same archive (e.g. the previous writer among several scanner instances)
+    def reload(self):
+        self.queue.put("reload")
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if item == "reload":
+                    self.state = None
+                    continue
+                ts, products = item
+                self.write(ts, {product['id']: product for product in products})
+                if ts - self.last_maintenance >= self.maintenance_interval:
+                    self.last_maintenance = ts
+                    self.maintain(ts)
+            except sqlite3.Error as e:
+                log(f"Error writing to {self.path}: {e}", level="error")
+                self.state = None
+            finally:
+                self.queue.task_done()
+
+    def load(self):
+        row = self.connection.execute("SELECT id, ts FROM frames WHERE keyframe = id ORDER BY ts DESC LIMIT 1").fetchone()
+        if row is None:
+            self.state, self.keyframe_id, self.keyframe_ts, self.deltas = {}, None, None, 0
+            return
+        self.keyframe_id, self.keyframe_ts = row
+        self.state = replay(self.connection, self.keyframe_id)
+        self.deltas = self.connection.execute("SELECT COUNT(*) - 1 FROM frames WHERE keyframe = ?", (self.keyframe_id,)).fetchone()[0]
+
+    def write(self, ts, state):
+        if self.state is None:
+            self.load()
+        if self.keyframe_id is not None and state == self.state:
+            return
+        with self.connection:
+            if self.keyframe_id is None or ts - self.keyframe_ts >= self.keyframe_interval or self.deltas >= self.max_deltas:
+                cursor = self.connection.execute("INSERT INTO frames (ts, keyframe, data) VALUES (?, 0, ?)", (ts, encode(state)))
+                self.connection.execute("UPDATE frames SET keyframe = id WHERE id = ?", (cursor.lastrowid,))
+                self.keyframe_id, self.keyframe_ts, self.deltas = cursor.lastrowid, ts, 0
+            else:
+                self.connection.execute("INSERT INTO frames (ts, keyframe, data) VALUES (?, ?, ?)",
+                                        (ts, self.keyframe_id, encode(make_delta(self.state, state))))
+                self.deltas += 1
+        self.state = state
+
+    # Apply the retention and compaction policies as of `now`
+    def maintain(self, now=None):
+        now = time.time() if now is None else now
+        with self.connection:
+            compact(self.connection, now - self.compact_after_days * 86400, self.compacted_keyframe_interval, self.max_deltas)
+            prune(self.connection, now - self.retention_days * 86400)
+        # Run as a script: through execute() the pragma stops after freeing a single page
+        self.connection.executescript("PRAGMA incremental_vacuum;")
+        # Compaction may have merged the current keyframe's group into an older one
+        self.state = None
+
+    # Wait until every queued scan has been archived
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        if self.worker.is_alive():
+            self.queue.put(None)
+            self.worker.join()
+        self.connection.close()
+
+    # Product state as of `ts`; see state_at()
+    def state_at(self, ts=None):
+        return archived_state(self.path, ts)
+
+# Delete frames older than `cutoff` that the state at `cutoff` does not need
+def prune(connection, cutoff):
+    row = connection.execute("SELECT ts FROM frames WHERE keyframe = id AND ts <= ? ORDER BY ts DESC LIMIT 1", (cutoff,)).fetchone()
+    if row is not None:
+        connection.execute("DELETE FROM frames WHERE ts < ?", (row[0],))
+
+# Rewrite keyframes older than `cutoff` as deltas, keeping one keyframe per `interval` seconds, or more where a
+# group would otherwise grow past `max_deltas` deltas
+# The rewritten keyframe's deltas move to the kept keyframe's group, so the frames themselves are unchanged
+def compact(connection, cutoff, interval, max_deltas):
+    kept_id = kept_ts = None
+    kept_frames = 0
+    for keyframe_id, ts, frames in connection.execute(
+            "SELECT id, ts, (SELECT COUNT(*) FROM frames AS delta WHERE delta.keyframe = frames.id) FROM frames "
+            "WHERE keyframe = id AND ts < ? ORDER BY ts", (cutoff,)).fetchall():
+        # The kept group's frames minus its keyframe, plus every frame of this group
+        if kept_id is None or ts - kept_ts >= interval or kept_frames - 1 + frames > max_deltas:
+            kept_id, kept_ts, kept_frames = keyframe_id, ts, frames
+            continue
+        kept_frames += frames
+        before = replay(connection, kept_id)
+        after = decode(connection.execute("SELECT data FROM frames WHERE id = ?", (keyframe_id,)).fetchone()[0])
+        connection.execute("UPDATE frames SET keyframe = ?, data = ? WHERE id = ?", (kept_id, encode(make_delta(before, after)), keyframe_id))
+        connection.execute("UPDATE frames SET keyframe = ? WHERE keyframe = ?", (kept_id, keyframe_id))
+
+def archived_state(path, ts=None):
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return state_at(connection, ts)
+    finally:
+        connection.close()
+
+def parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').timestamp()
+
+# Command line interface
+#   python snapshot_archive.py at "2026-03-01 14:30:00"           every product as it was at that time, one JSON line each
+#   python snapshot_archive.py at 1772375400 --pair XYZ-USD        one product
+#   python snapshot_archive.py stats                               frames, keyframes, time span and size
+#   python snapshot_archive.py compact                             apply the retention and compaction policies now
+def main(argv=None):
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Inspect the scanner's snapshot archive.")
+    parser.add_argument("--db", default=os.path.join(script_dir, "archive.db"), help="path to the archive database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    at_parser = subparsers.add_parser("at", help="product state at a time (unix timestamp or 'YYYY-MM-DD HH:MM:SS')")
+    at_parser.add_argument("time")
+    at_parser.add_argument("--pair")
+
+    subparsers.add_parser("stats", help="summarize the archive")
+
+    compact_parser = subparsers.add_parser("compact", help="apply the retention and compaction policies")
+    compact_parser.add_argument("--retention-days", type=float, default=365.0)
+    compact_parser.add_argument("--compact-after-days", type=float, default=30.0)
+
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        print(f"{args.db} does not exist yet.")
+        return 1
+
+    if args.command == "at":
+        started = time.perf_counter()
+        state = archived_state(args.db, parse_time(args.time))
+        elapsed = (time.perf_counter() - started) * 1000
+        if state is None:
+            print("The archive has no state that old.")
+            return 1
+        for product_id in ([args.pair] if args.pair else sorted(state)):
+            if product_id in state:
+                print(json.dumps(state[product_id], sort_keys=True))
+        print(f"{len(state)} products, reconstructed in {elapsed:.1f} ms", file=sys.stderr)
+    elif args.command == "stats":
+        connection = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+        try:
+            frames, keyframes, first, last, size = connection.execute(
+                "SELECT COUNT(*), SUM(keyframe = id), MIN(ts), MAX(ts), SUM(LENGTH(data)) FROM frames").fetchone()
+        finally:
+            connection.close()
+        print(f"{frames} frames ({keyframes or 0} keyframes), {(size or 0) / 1e6:.1f} MB compressed, file {os.path.getsize(args.db) / 1e6:.1f} MB")
+        if frames:
+            print(f"{datetime.fromtimestamp(first).strftime('%Y-%m-%d %H:%M:%S')} to {datetime.fromtimestamp(last).strftime('%Y-%m-%d %H:%M:%S')}")
+    else:
+        archive = SnapshotArchive(args.db, retention_days=args.retention_days, compact_after_days=args.compact_after_days)
+        archive.maintain()
+        archive.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
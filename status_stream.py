@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import json
+import random
+from datetime import datetime
+from instrumentation import log, REGISTRY
+
+# Coinbase Exchange WebSocket feed
+# The status channel pushes every product's status, status_message and trading-mode flags on a short interval
+STATUS_FEED_URL = "wss://ws-feed.exchange.coinbase.com"
+
+# Streaming alternative to polling /products
+# Status channel messages are merged into the scanner's product snapshot and run through the same new-pair,
+# enabled/disabled and field-change detection as a REST scan, so a change is seen as soon as it is pushed.
+# A low-frequency REST scan still runs in the background, and immediately after every (re)connect,
+# to catch anything that happened while the socket was down and pairs the channel does not report.
+# Requires the `websockets` package (pip install websockets).
+class StatusStream:
+    def __init__(self, scanner, url=STATUS_FEED_URL, reconcile_interval=60.0, heartbeat_timeout=30.0,
+                 heartbeat_product="BTC-USD", max_reconnect_delay=60.0):
+        self.scanner = scanner
+        self.url = url
+        self.reconcile_interval = reconcile_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.heartbeat_product = heartbeat_product
+        self.max_reconnect_delay = max_reconnect_delay
+        self.stopped = False
+
+        # Hash of the last status message applied; the channel repeats identical snapshots,
+        # and those are skipped before decoding just like an unchanged REST payload
+        self.last_message_hash = None
+        self.reconcile_now = asyncio.Event()
+
+        # Counters for messages handled, status updates applied, reconnects and completed reconciliation scans
+        self.message_count = 0
+        self.update_count = 0
+        self.reconnect_count = 0
+        self.reconcile_count = 0
+        REGISTRY.gauge("pair_scanner_stream_reconnects", "Status stream reconnects.", function=lambda: self.reconnect_count)
+        REGISTRY.gauge("pair_scanner_stream_updates", "Status channel messages applied.", function=lambda: self.update_count)
+
+    def subscribe_message(self):
+        # The heartbeat channel needs a product id; one product is enough to prove the connection is alive
+        return json.dumps({
+            "type": "subscribe",
+            "channels": [
+                {"name": "status"},
+                {"name": "heartbeat", "product_ids": [self.heartbeat_product]},
+            ],
+        })
+
+    def stop(self):
+        self.stopped = True
+        self.reconcile_now.set()
+
+    async def run(self):
+        reconcile_task = asyncio.create_task(self.reconcile_loop())
+        try:
+            await self.stream_loop()
+        finally:
+            reconcile_task.cancel()
+
+    # Keep a connection open, reconnecting with jittered exponential backoff whenever it drops
+    async def stream_loop(self):
+        try:
+            import websockets
+        except ImportError:
+            raise RuntimeError("Streaming mode requires the websockets package: pip install websockets")
+
+        failures = 0
+        while not self.stopped:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, ping_timeout=20, max_size=None) as ws:
+                    await ws.send(self.subscribe_message())
+                    log(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - Connected to {self.url}, subscribed to status channel.")
+                    failures = 0
+                    # Whatever changed while we were disconnected is picked up by a REST scan right away
+                    self.reconcile_now.set()
+                    await self.read_messages(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - Status stream error: {e}", level="error")
+
+            if self.stopped:
+                break
+            failures += 1
+            self.reconnect_count += 1
+            delay = min(self.max_reconnect_delay, 2 ** (failures - 1))
+            delay = random.uniform(delay / 2, delay)
+            log(f"Reconnecting to status stream in {delay:.1f} s.")
+            await asyncio.sleep(delay)
+
+    # Read messages until the connection fails or goes quiet for longer than heartbeat_timeout
+    async def read_messages(self, ws):
+        while not self.stopped:
+            try:
+                raw = await asyncio.wait_for(ws.recv(), self.heartbeat_timeout)
+            except asyncio.TimeoutError:
+                raise ConnectionError(f"no message for {self.heartbeat_timeout:.0f} s")
+            await self.handle_message(raw)
+            self.message_count += 1
+
+    async def handle_message(self, raw):
+        if isinstance(raw, bytes):
+            raw = raw.decode()
+        # Heartbeats arrive every second and only prove the connection is alive
+        if '"heartbeat"' in raw[:40]:
+            return
+
+        message_hash = hashlib.blake2b(raw.encode(), digest_size=16).digest()
+        if message_hash == self.last_message_hash:
+            return
+
+        message = json.loads(raw)
+        message_type = message.get("type")
+        if message_type == "status":
+            # The scanner does blocking file and queue work, so it runs in a worker thread
+            await asyncio.to_thread(self.scanner.apply_status_update, message.get("products", []))
+            self.last_message_hash = message_hash
+            self.update_count += 1
+        elif message_type == "error":
+            raise ConnectionError(f"{message.get('message')}: {message.get('reason')}")
+
+    # Periodic REST scan to reconcile the streamed state, also triggered right after each (re)connect
+    async def reconcile_loop(self):
+        while not self.stopped:
+            try:
+                await asyncio.wait_for(self.reconcile_now.wait(), self.reconcile_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.reconcile_now.clear()
+            if self.stopped:
+                break
+            try:
+                await asyncio.to_thread(self.scanner.scan)
+            except Exception as e:
+                log(f"{datetime.now().strftime('%m-%d-%y %H:%M:%S')} - Error during reconciliation scan: {e}", level="error")
+            self.reconcile_count += 1
@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import threading
+import http.server
+import pytest
+
+# The scanner's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Local HTTP stand-in for the APIs the scanner talks to
+# respond(method, path, body) is called for every request and returns (status, payload, headers); a payload that is
+# not bytes is sent as JSON. Handlers run on their own threads, so one may sleep to play a slow server.
+class StandIn:
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def handle_request(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                stand_in.requests.append((self.command, self.path, body))
+                status, payload, headers = stand_in.respond(self.command, self.path, body)
+                data = payload if isinstance(payload, bytes) else b"" if payload is None else json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# stand_in(respond) starts a stand-in server; every one started by a test is shut down after it
+@pytest.fixture
+def stand_in():
+    servers = []
+
+    def start(respond):
+        server = StandIn(respond)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+# Product record in the Coinbase Exchange /products format
+def product(pair_id, **fields):
+    record = dict(id=pair_id, base_currency=pair_id.split('-')[0], quote_currency=pair_id.rsplit('-', 1)[-1],
+                  post_only=False, limit_only=False, cancel_only=False, status="online", status_message="",
+                  trading_disabled=False, auction_mode=False)
+    record.update(fields)
+    return record
+
+# Poll condition() until it is true; fails the test after `timeout` seconds
+def wait_until(condition, timeout=5.0):
+    import time
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the stand-in"
+        time.sleep(0.01)
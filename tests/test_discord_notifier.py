@@ -0,0 +1,61 @@
+import json
+from conftest import wait_until
+from discord_notifier import DiscordNotifier, split_message, DISCORD_MESSAGE_LIMIT
+
+def posted(server):
+    return [json.loads(body)["content"] for method, path, body in server.requests]
+
+def test_retries_after_429(stand_in, tmp_path):
+    responses = [(429, {"retry_after": 0.05}, None), (204, None, None)]
+    server = stand_in(lambda method, path, body: responses.pop(0))
+    notifier = DiscordNotifier(server.url, str(tmp_path / "pending.json"), coalesce_window=0.01)
+    notifier.start()
+    notifier.send("BTC-USD has been detected.\n")
+    assert notifier.flush(timeout=5)
+    notifier.stop()
+
+    assert posted(server) == ["BTC-USD has been detected.\n"] * 2
+    assert notifier.rate_limited_count == 1
+    assert notifier.sent_count == 1
+    assert json.loads((tmp_path / "pending.json").read_text()) == []
+
+def test_long_messages_are_split_on_lines(stand_in, tmp_path):
+    server = stand_in(lambda method, path, body: (204, None, None))
+    notifier = DiscordNotifier(server.url, str(tmp_path / "pending.json"), coalesce_window=0.01)
+    notifier.start()
+    content = "".join(f"PAIR{i}-USD has been detected.\n" for i in range(200))
+    notifier.send(content)
+    assert notifier.flush(timeout=5)
+    notifier.stop()
+
+    messages = posted(server)
+    assert len(messages) > 1
+    assert all(len(message) <= DISCORD_MESSAGE_LIMIT and message.endswith("\n") for message in messages)
+    assert "".join(messages) == content
+
+def test_split_message_hard_splits_long_lines():
+    assert split_message("a" * 5 + "\nb\n", limit=3) == ["aaa", "aa\n", "b\n"]
+
+def test_stop_keeps_only_the_undelivered_chunks(stand_in, tmp_path):
+    # The first chunk is accepted, then Discord keeps answering 429 until the notifier is stopped
+    def respond(method, path, body):
+        if len(server.requests) == 1:
+            return 204, None, None
+        return 429, {"retry_after": 30}, None
+    server = stand_in(respond)
+    pending_path = str(tmp_path / "pending.json")
+    notifier = DiscordNotifier(server.url, pending_path, coalesce_window=0.01)
+    notifier.start()
+    first = "".join(f"PAIR{i}-USD has been detected.\n" for i in range(100))
+    second = "ETH-USD trading has been enabled.\n"
+    notifier.send(first)
+    notifier.send(second)
+    wait_until(lambda: len(server.requests) >= 2)
+    notifier.stop()
+
+    delivered = posted(server)[0]
+    assert first.startswith(delivered)
+    remainder = json.loads(open(pending_path).read())
+    assert "".join(remainder) == (first + second)[len(delivered):]
+    # A restart delivers only what Discord had not accepted
+    assert DiscordNotifier(server.url, pending_path).pending == remainder
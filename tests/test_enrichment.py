@@ -0,0 +1,72 @@
+import time
+from conftest import product
+from enrichment import Enricher
+from fetch_usd_pairs import PairScanner
+
+RESPONSES = {
+    "product": {"base_increment": "0.01", "base_min_size": "1"},
+    "stats": {"low": "1.5", "high": "2.25", "volume": "123456.7", "last": "2"},
+    "ticker": {"price": "2.01"},
+}
+DETAILS = "Price 2.01 | 24h vol 123,457 | 24h range 1.5-2.25 | base increment 0.01 | min size 1"
+
+# Stand-in for the detail endpoints; pairs named SLOW-* answer after `delay` seconds
+def detail_api(stand_in, delay=1.0):
+    def respond(method, path, body):
+        parts = path.strip("/").split("/")
+        if parts[1].startswith("SLOW-"):
+            time.sleep(delay)
+        return 200, RESPONSES["product" if len(parts) == 2 else parts[2]], None
+    return stand_in(respond)
+
+def test_enrich_keeps_to_its_deadline(stand_in):
+    server = detail_api(stand_in)
+    enricher = Enricher(server.url, deadline=0.3)
+    started = time.monotonic()
+    details = enricher.enrich(["NEW-USD", "SLOW-USD"])
+    assert time.monotonic() - started < 0.8
+    assert details == {"NEW-USD": DETAILS}
+    enricher.close()
+
+def test_enrich_serves_from_the_cache(stand_in):
+    server = detail_api(stand_in, delay=0.5)
+    enricher = Enricher(server.url, deadline=0.1)
+    assert enricher.enrich(["SLOW-USD"]) == {}
+    # The lookups that missed the deadline kept running and filled the cache
+    time.sleep(0.8)
+    requests_made = len(server.requests)
+    assert enricher.enrich(["SLOW-USD"]) == {"SLOW-USD": DETAILS}
+    assert len(server.requests) == requests_made == 3
+    enricher.close()
+
+def test_bulk_detections_get_no_details(stand_in):
+    server = detail_api(stand_in)
+    enricher = Enricher(server.url, max_pairs=2)
+    assert enricher.enrich(["A-USD", "B-USD", "C-USD"]) == {}
+    assert server.requests == []
+    enricher.close()
+
+def test_scan_does_not_wait_for_details(stand_in, tmp_path):
+    details = detail_api(stand_in)
+    payload = [product("BTC-USD")]
+    products = stand_in(lambda method, path, body: (200, payload, None))
+    sent = []
+    enricher = Enricher(details.url, deadline=0.5)
+    scanner = PairScanner(str(tmp_path), products.url + "/products", notify=lambda content, quote: sent.append(content), enricher=enricher)
+    scanner.scan()
+    scanner.flush_notifications()
+    sent.clear()
+
+    payload.append(product("SLOW-USD"))
+    payload.append(product("NEW-USD"))
+    started = time.monotonic()
+    scanner.scan()
+    assert time.monotonic() - started < 0.3
+    scanner.flush_notifications()
+    # New-pair alert first, then the field changes of the new pairs
+    assert len(sent) == 2
+    assert f"NEW-USD has been detected.\n<https://www.coinbase.com/advanced-trade/spot/NEW-USD>\n{DETAILS}\n" in sent[0]
+    assert "SLOW-USD has been detected.\n<https://www.coinbase.com/advanced-trade/spot/SLOW-USD>\n" in sent[0]
+    scanner.close_delivery()
+    scanner.events.close()
+    enricher.close()
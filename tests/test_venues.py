@@ -0,0 +1,60 @@
+import time
+import asyncio
+from conftest import product
+from venues import CoinbaseExchangeAdapter, VenueFetcher
+from scan_scheduler import ScanScheduler, SCAN_CHANGED, SCAN_UNCHANGED, SCAN_ERROR, SCAN_RATE_LIMITED, SCAN_SKIPPED
+from fetch_usd_pairs import PairScanner
+
+# Venues in the Coinbase Exchange format under other names, so several can be watched at once
+class SlowAdapter(CoinbaseExchangeAdapter):
+    name = "slow"
+
+class FailingAdapter(CoinbaseExchangeAdapter):
+    name = "failing"
+
+def test_slow_and_failing_venues_only_cost_their_own_products(stand_in):
+    good = stand_in(lambda method, path, body: (200, [product("BTC-USD")], None))
+    slow = stand_in(lambda method, path, body: (time.sleep(1.0), (200, [], None))[1])
+    failing = stand_in(lambda method, path, body: (500, None, None))
+    fetcher = VenueFetcher([CoinbaseExchangeAdapter(good.url, timeout=0.2), SlowAdapter(slow.url, timeout=0.2),
+                            FailingAdapter(failing.url, timeout=0.2)], backoff_base=30)
+
+    started = time.monotonic()
+    result, products = fetcher.fetch()
+    assert time.monotonic() - started < 0.8
+    assert result == SCAN_CHANGED
+    assert [record["id"] for record in products] == ["BTC-USD"]
+
+    # The failing venue is backing off and the slow one is still busy, so only the good one is asked again
+    result, products = fetcher.fetch()
+    assert result == SCAN_UNCHANGED
+    assert len(good.requests) == 2
+    assert len(slow.requests) == 1
+    assert len(failing.requests) == 1
+
+def test_every_venue_backing_off_is_a_skipped_scan(stand_in):
+    server = stand_in(lambda method, path, body: (429, None, None))
+    fetcher = VenueFetcher([CoinbaseExchangeAdapter(server.url)], backoff_base=30)
+    assert fetcher.fetch() == (SCAN_RATE_LIMITED, None)
+    assert fetcher.rate_limited()
+    assert fetcher.fetch() == (SCAN_SKIPPED, None)
+    assert len(server.requests) == 1
+
+def test_skipped_scans_are_not_fast_path_hits(stand_in, tmp_path):
+    server = stand_in(lambda method, path, body: (503, None, None))
+    scanner = PairScanner(str(tmp_path), server.url + "/products", notify=lambda content, quote: None)
+    scanner.fetcher.backoff_base = 30
+    assert [scanner.scan() for _ in range(3)] == [SCAN_ERROR, SCAN_SKIPPED, SCAN_SKIPPED]
+    assert scanner.fast_path_count == 0
+    scanner.events.close()
+
+def test_skipped_scans_keep_the_scheduler_backing_off():
+    results = [SCAN_ERROR, SCAN_SKIPPED, SCAN_ERROR]
+    def scan():
+        result = results.pop(0)
+        if not results:
+            scheduler.stop()
+        return result
+    scheduler = ScanScheduler(scan, interval=0.01, burst_interval=0.01, backoff_base=0.01, requests_per_second=100)
+    asyncio.run(scheduler.run())
+    assert scheduler.consecutive_failures == 2
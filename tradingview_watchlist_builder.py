@@ -1,27 +1,28 @@
 import os
+import glob
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from discord_webhook import DiscordWebhook
+from file_utils import write_file_atomic
+from instrumentation import log
 
 # Configuration
 send_to_discord = True  # Set to True if you want the watchlist file to be sent to Discord automatically
-webhook_url = 'https://discord.com/api/webhooks/your_webhook_id/your_webhook_token'  # Replace with your Discord webhook URL
+webhook_url = os.getenv('WATCHLIST_WEBHOOK_URL', 'https://discord.com/api/webhooks/your_webhook_id/your_webhook_token')  # Replace with your Discord webhook URL or set WATCHLIST_WEBHOOK_URL
 
 # Get the directory where the script is located
 # This ensures that file paths are correctly referenced relative to the script's location
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Get the current date and format it as M-D-YY
-# This date stamp will be used in the filenames for easy identification
-date_stamp = datetime.now().strftime("%m-%d-%y")
+# Variant spec: every watchlist to build, read from watchlists.toml next to the script when it exists
+# (see watchlists.example.toml); without one the two original watchlists below are built
+spec_path = os.path.join(script_dir, 'watchlists.toml')
 
-# Define the full path to the input file
-# 'TV-Coinbase-Watchlist.txt' should contain the list of trading pairs to be added to the watchlist
-input_file_path = os.path.join(script_dir, 'TV-Coinbase-Watchlist.txt')
-
-# Define the full paths to the output files
-# Two separate watchlist files will be created: one for personal use and one formatted for Discord
-output_file_path_personal = os.path.join(script_dir, f'Watchlist - {date_stamp}.txt')
-output_file_path_discord = os.path.join(script_dir, f'Watchlist - {date_stamp} - Discord.txt')
+# TradingView refuses watchlists with more symbols than this; longer variants are split into numbered parts
+symbol_limit = 1000
 
 # Define common pairs to be included in the watchlists
 # These include market leaders, Bitcoin ETFs, staking assets, and stablecoins
@@ -60,92 +61,317 @@ COINBASE:PYUSDUSD,
 COINBASE:GUSDUSD,
 COINBASE:GYENUSD,"""
 
-# Base template with sections for personal use (includes SECTION 1)
-# SECTION 1 is meant for pairs that are relevant to the user but not included in the Discord version
-base_template_personal = f"""###MARKET LEADERS,
-{market_leaders_pairs}
+# Turn one of the pair blocks above into a list of symbols
+def parse_symbols(block):
+    return [pair.strip() for pair in block.split(',') if pair.strip()]
+
+# The original two watchlists, expressed as a variant spec
+# A section either lists fixed symbols, or takes the traded pairs of some quote currencies ('listings');
+# listed pairs that a variant already shows in one of its fixed sections are left out, so nothing appears twice
+DEFAULT_SPEC = {
+    "symbol_limit": symbol_limit,
+    "sections": {
+        "market_leaders": {"title": "MARKET LEADERS", "symbols": parse_symbols(market_leaders_pairs)},
+        "bitcoin_etfs": {"title": "BITCOIN ETF'S", "symbols": parse_symbols(bitcoin_etfs_pairs)},
+        # SECTION 1 is meant for pairs that are relevant to the user but not included in the Discord version
+        "section_1": {"title": "SECTION 1", "symbols": ["NYSE:GME", "NYSE:AMC"]},
+        "crypto_flood": {"title": "CRYPTO FLOOD", "listings": ["USD"]},
+        "stakes": {"title": "STAKES", "symbols": parse_symbols(stakes_pairs)},
+        "stablecoins": {"title": "STABLECOINS", "symbols": parse_symbols(stablecoins_pairs)},
+    },
+    "variants": [
+        # This file is tailored for the user's personal use, including the custom SECTION 1
+        {"name": "personal", "filename": "Watchlist - {date}.txt",
+         "sections": ["market_leaders", "bitcoin_etfs", "section_1", "crypto_flood", "stakes", "stablecoins"]},
+        # This version is prepared specifically for sharing on Discord
+        {"name": "discord", "filename": "Watchlist - {date} - Discord.txt",
+         "sections": ["market_leaders", "bitcoin_etfs", "crypto_flood", "stakes", "stablecoins"],
+         "upload": send_to_discord},
+    ],
+}
+
+# TOML support is optional: tomllib is in the standard library from Python 3.11, and tomli provides it before that
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+def load_spec(path=spec_path):
+    if not os.path.exists(path):
+        return DEFAULT_SPEC
+    if tomllib is None:
+        raise RuntimeError(f"Reading {path} requires Python 3.11 or the tomli package.")
+    with open(path, "rb") as file:
+        return tomllib.load(file)
+
+class Variant:
+    def __init__(self, name, filename, sections, excluded, upload, webhook_url, message, symbol_limit):
+        self.name = name
+        self.filename = filename
+        self.sections = sections
+        self.excluded = excluded
+        self.upload = upload
+        self.webhook_url = webhook_url
+        self.message = message
+        self.symbol_limit = symbol_limit
+        # Quote currencies whose listings this variant shows; it is only built once all of them are known
+        self.quotes = {quote for section in sections if section["listings"] is not None for quote in section["listings"]}
+
+# A variant spec compiled once into the form rendering needs
+# Fixed sections keep their symbols as tuples, and each variant gets a frozenset of everything its fixed sections
+# already show (plus its 'exclude' list); variants with the same set share it, so filtering the listings
+# is one membership test per pair and exclusion set, however many variants there are
+class WatchlistSpec:
+    def __init__(self, spec, default_webhook_url=webhook_url):
+        default_limit = spec.get("symbol_limit", symbol_limit)
+        sections = {}
+        for name, section in spec.get("sections", {}).items():
+            listings = section.get("listings")
+            sections[name] = {
+                "title": section.get("title", name.upper()),
+                "symbols": tuple(section.get("symbols", ())),
+                "listings": tuple(listings) if listings is not None else None,
+            }
+
+        exclusion_sets = {}
+        self.variants = []
+        for variant in spec.get("variants", []):
+            try:
+                variant_sections = [sections[name] for name in variant["sections"]]
+            except KeyError as e:
+                raise ValueError(f"Watchlist variant {variant.get('name')!r} uses unknown section {e}") from None
+            excluded = frozenset(symbol for section in variant_sections for symbol in section["symbols"]) | frozenset(variant.get("exclude", ()))
+            excluded = exclusion_sets.setdefault(excluded, excluded)
+
+            limit = int(variant.get("symbol_limit", default_limit))
+            if limit < 1:
+                raise ValueError(f"Watchlist variant {variant['name']!r} has symbol_limit {limit}; it must be at least 1")
+
+            url = variant.get("webhook") or (os.getenv(variant["webhook_env"]) if variant.get("webhook_env") else None) or default_webhook_url
+            self.variants.append(Variant(
+                variant["name"], variant.get("filename", f"Watchlist - {{date}} - {variant['name']}.txt"), variant_sections, excluded,
+                bool(variant.get("upload", False)), url, variant.get("message", "Here is the latest watchlist file for Coinbase:"),
+                limit))
+
+    # Render every variant whose quote currencies are all in symbols_by_quote ({quote: symbols})
+    # Returns {variant name: [(filename, content), ...]}, with more than one file when a variant is split into parts
+    def render(self, symbols_by_quote, date_stamp):
+        # Sort each quote's listings once, then filter them once per distinct (quotes, exclusion set) combination
+        sorted_symbols = {quote: sorted(set(symbols)) for quote, symbols in symbols_by_quote.items()}
+        filtered = {}
+        outputs = {}
+        for variant in self.variants:
+            if not variant.quotes <= sorted_symbols.keys():
+                continue
+            blocks = []
+            for section in variant.sections:
+                if section["listings"] is None:
+                    symbols = section["symbols"]
+                else:
+                    key = (section["listings"], id(variant.excluded))
+                    symbols = filtered.get(key)
+                    if symbols is None:
+                        listed = sorted({symbol for quote in section["listings"] for symbol in sorted_symbols[quote]})
+                        symbols = filtered[key] = [symbol for symbol in listed if symbol not in variant.excluded]
+                blocks.append((section["title"], symbols))
+            outputs[variant.name] = render_variant(variant, blocks, date_stamp)
+        return outputs
 
-###BITCOIN ETF'S,
-{bitcoin_etfs_pairs}
+# Render one variant's sections as TradingView watchlist text, one file per symbol_limit symbols
+# A section that does not fit in the current part is continued in the next one under the same heading
+def render_variant(variant, blocks, date_stamp):
+    parts = [[]]
+    count = 0
+    for title, symbols in blocks:
+        symbols = list(symbols)
+        if not symbols:
+            parts[-1].append((title, []))
+            continue
+        while symbols:
+            if count == variant.symbol_limit:
+                parts.append([])
+                count = 0
+            take = symbols[:variant.symbol_limit - count]
+            symbols = symbols[len(take):]
+            parts[-1].append((title, take))
+            count += len(take)
 
-###SECTION 1,
-NYSE:GME,
-NYSE:AMC,
+    filename = variant.filename.format(date=date_stamp, name=variant.name)
+    files = []
+    for number, part in enumerate(parts, 1):
+        content = "\n".join(f"###{title},\n" + "".join(f"{symbol},\n" for symbol in symbols) for title, symbols in part)
+        if len(parts) > 1:
+            base, extension = os.path.splitext(filename)
+            files.append((f"{base} - Part {number}{extension}", content))
+        else:
+            files.append((filename, content))
+    return files
 
-###CRYPTO FLOOD,
-{{crypto_flood_pairs}},
+# Read pairs from TV-Coinbase-Watchlist.txt (USD) and TV-Coinbase-Watchlist-<QUOTE>.txt (other quote currencies)
+# These are the new pairs that will be added under the listings sections, e.g. 'CRYPTO FLOOD'
+def read_watchlist_pairs(input_file_path):
+    with open(input_file_path, 'r') as file:
+        return {line.strip().rstrip(',') for line in file if line.strip()}
 
-###STAKES,
-{stakes_pairs}
+def read_watchlist_files(directory):
+    symbols_by_quote = {}
+    usd_path = os.path.join(directory, 'TV-Coinbase-Watchlist.txt')
+    if os.path.exists(usd_path):
+        symbols_by_quote['USD'] = read_watchlist_pairs(usd_path)
+    for path in glob.glob(os.path.join(directory, 'TV-Coinbase-Watchlist-*.txt')):
+        quote = os.path.basename(path)[len('TV-Coinbase-Watchlist-'):-len('.txt')]
+        symbols_by_quote[quote] = read_watchlist_pairs(path)
+    return symbols_by_quote
 
-###STABLECOINS,
-{stablecoins_pairs}
-"""
+# Build the personal and Discord watchlist contents of the default spec from a collection of USD pairs (e.g. 'COINBASE:BTCUSD')
+def build_watchlists(pairs):
+    outputs = WatchlistSpec(DEFAULT_SPEC).render({'USD': pairs}, datetime.now().strftime("%m-%d-%y"))
+    return outputs["personal"][0][1], outputs["discord"][0][1]
 
-# Base template for Discord (excludes SECTION 1)
-# This version is formatted specifically for sending to Discord and excludes personal sections
-base_template_discord = f"""###MARKET LEADERS,
-{market_leaders_pairs}
+# Upload one variant's files to its webhook; Discord takes up to 10 attachments per message
+def upload_variant(variant, files):
+    for start in range(0, len(files), 10):
+        webhook = DiscordWebhook(url=variant.webhook_url, content=variant.message)
+        for filename, content in files[start:start + 10]:
+            webhook.add_file(file=content.encode(), filename=filename)
+        response = webhook.execute()
+        if response is None or not response.ok:
+            return False
+    return True
 
-###BITCOIN ETF'S,
-{bitcoin_etfs_pairs}
+# Builds, writes and uploads every watchlist variant
+# The spec is compiled once when the builder is created. Each variant's output is hashed, and the hashes of the last
+# published versions are kept in watchlist_published.json, so a variant that has not changed (after a restart, or for
+# a change that does not affect it) is neither rewritten nor uploaded again. Changed variants are uploaded concurrently.
+# The scanner runs one of these in-process: submit() hands over a quote currency's latest pairs and returns
+# immediately, and a background thread publishes them, coalescing changes that arrive together or during an upload.
+class WatchlistBuilder:
+    def __init__(self, directory=script_dir, spec=None, max_uploads=4, coalesce_window=1.0):
+        self.directory = directory
+        self.spec = WatchlistSpec(spec if spec is not None else load_spec(os.path.join(directory, 'watchlists.toml')))
+        self.max_uploads = max_uploads
+        self.coalesce_window = coalesce_window
+        self.state_path = os.path.join(directory, "watchlist_published.json")
+        self.published = self.load_state()
 
-###CRYPTO FLOOD,
-{{crypto_flood_pairs}},
+        # Latest pairs per quote currency, as submitted by the scanner
+        self.symbols_by_quote = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.worker = None
 
-###STAKES,
-{stakes_pairs}
+    def load_state(self):
+        try:
+            with open(self.state_path, "r") as file:
+                return json.load(file).get("variants", {})
+        except (FileNotFoundError, ValueError):
+            return {}
 
-###STABLECOINS,
-{stablecoins_pairs}
-"""
+    def save_state(self):
+        write_file_atomic(self.state_path, json.dumps({"variants": self.published, "published": datetime.now().isoformat(timespec="seconds")}))
 
-# Create a set of pairs that are already included in the base templates to prevent duplicates
-# This ensures that the same trading pairs aren't added multiple times
-existing_pairs_personal = set(pair.strip() for pair in base_template_personal.split(',') if pair.strip())
-existing_pairs_discord = set(pair.strip() for pair in base_template_discord.split(',') if pair.strip())
+    # Remove the files of an earlier render of the variant with the same date that this one did not write again:
+    # the higher parts after the variant shrank, or the unsplit file after it was split (and the other way round)
+    def remove_stale_parts(self, variant, date_stamp, written):
+        filename = variant.filename.format(date=date_stamp, name=variant.name)
+        base, extension = os.path.splitext(filename)
+        candidates = [filename] + [os.path.basename(path) for path in glob.glob(os.path.join(glob.escape(self.directory), f"{glob.escape(base)} - Part *{glob.escape(extension)}"))]
+        for stale in sorted(set(candidates) - written):
+            try:
+                os.remove(os.path.join(self.directory, stale))
+            except FileNotFoundError:
+                continue
+            log(f"Watchlist file '{stale}' has been removed.")
 
-# Read pairs from TV-Coinbase-Watchlist.txt
-# These are the new pairs that will be added under the 'CRYPTO FLOOD' section
-with open(input_file_path, 'r') as file:
-    new_pairs = {line.strip().rstrip(',') for line in file if line.strip()}
+    # Publish the watchlists for symbols_by_quote ({quote: TradingView symbols}), or for the
+    # TV-Coinbase-Watchlist files when none are given
+    # Returns the names of the variants that were written
+    def publish(self, symbols_by_quote=None):
+        if symbols_by_quote is None:
+            symbols_by_quote = read_watchlist_files(self.directory)
 
-# Filter out any pairs that are already in the base templates or duplicates
-# This step ensures that only unique pairs are added to the final watchlists
-unique_pairs_personal = sorted(pair for pair in new_pairs if pair not in existing_pairs_personal)
-unique_pairs_discord = sorted(pair for pair in new_pairs if pair not in existing_pairs_discord)
+        # Get the current date and format it as M-D-YY
+        # This date stamp will be used in the filenames for easy identification
+        date_stamp = datetime.now().strftime("%m-%d-%y")
+        outputs = self.spec.render(symbols_by_quote, date_stamp)
 
-# Convert the list of unique pairs back to a string with commas and newlines for insertion into the templates
-crypto_flood_content_personal = ',\n'.join(unique_pairs_personal)
-crypto_flood_content_discord = ',\n'.join(unique_pairs_discord)
+        changed = []
+        for variant in self.spec.variants:
+            files = outputs.get(variant.name)
+            if files is None:
+                continue
+            content_hash = hashlib.blake2b("\0".join(content for filename, content in files).encode(), digest_size=16).hexdigest()
+            if content_hash == self.published.get(variant.name):
+                continue
+            for filename, content in files:
+                write_file_atomic(os.path.join(self.directory, filename), content)
+                log(f"Watchlist file '{filename}' has been created.")
+            self.remove_stale_parts(variant, date_stamp, {filename for filename, content in files})
+            changed.append((variant, files, content_hash))
 
-# Insert the new pairs into the base templates
-# The templates are populated with the filtered pairs under the 'CRYPTO FLOOD' section
-output_content_personal = base_template_personal.format(crypto_flood_pairs=crypto_flood_content_personal)
-output_content_discord = base_template_discord.format(crypto_flood_pairs=crypto_flood_content_discord)
+        if not changed:
+            log("Watchlists are unchanged since they were last published.")
+            return []
 
-# Write the personal file (with SECTION 1)
-# This file is tailored for the user's personal use, including the custom SECTION 1
-with open(output_file_path_personal, 'w') as output_file:
-    output_file.write(output_content_personal)
+        # Conditionally send the files to Discord, every variant's upload in parallel
+        uploads = [(variant, files) for variant, files, content_hash in changed if variant.upload]
+        results = {}
+        if uploads:
+            with ThreadPoolExecutor(max_workers=self.max_uploads) as executor:
+                results = dict(zip((variant.name for variant, files in uploads),
+                                   executor.map(lambda upload: upload_variant(*upload), uploads)))
+        for variant, files, content_hash in changed:
+            if variant.upload:
+                if not results[variant.name]:
+                    # Leave the hash alone so the next publish tries the upload again
+                    log(f"Failed to upload the '{variant.name}' watchlist to Discord.", level="error")
+                    continue
+                log(f"The '{variant.name}' watchlist ({len(files)} file(s)) has been uploaded to Discord.")
+            self.published[variant.name] = content_hash
+        self.save_state()
+        return [variant.name for variant, files, content_hash in changed]
 
-print(f"Personal watchlist file '{output_file_path_personal}' has been created.")
+    def start(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.run, name="watchlist-builder", daemon=True)
+            self.worker.start()
 
-# Write the Discord file (without SECTION 1)
-# This version is prepared specifically for sharing on Discord
-with open(output_file_path_discord, 'w') as output_file:
-    output_file.write(output_content_discord)
+    # Queue a quote currency's latest TradingView symbols for publishing without blocking
+    def submit(self, quote, symbols):
+        with self.lock:
+            self.symbols_by_quote[quote] = list(symbols)
+            self.dirty = True
+        self.wake.set()
 
-print(f"Discord watchlist file '{output_file_path_discord}' has been created.")
+    def stop(self, timeout=10):
+        self.stop_event.set()
+        self.wake.set()
+        if self.worker is not None:
+            self.worker.join(timeout)
+            self.worker = None
 
-# Conditionally send the file to Discord
-# If send_to_discord is set to True, the file will be uploaded to the specified Discord channel
-if send_to_discord:
-    webhook = DiscordWebhook(url=webhook_url, content="Here is the latest watchlist file for Coinbase:")
-    with open(output_file_path_discord, "rb") as f:
-        webhook.add_file(file=f.read(), filename=f'Watchlist - {date_stamp} - Discord.txt')
-    response = webhook.execute()
+    def run(self):
+        while True:
+            self.wake.wait()
+            # Let the other quote currencies of the same scan arrive before building
+            self.stop_event.wait(self.coalesce_window)
+            self.wake.clear()
+            with self.lock:
+                symbols_by_quote = dict(self.symbols_by_quote) if self.dirty else None
+                self.dirty = False
+            if symbols_by_quote is not None:
+                try:
+                    self.publish(symbols_by_quote)
+                except Exception as e:
+                    log(f"Error publishing watchlists: {e}", level="error")
+            if self.stop_event.is_set():
+                break
 
-    print(f"File '{output_file_path_discord}' uploaded to Discord.")
-else:
-    print("File was not uploaded to Discord as per the configuration.")
+# Build the watchlists from the TV-Coinbase-Watchlist files once, as the standalone script always has
+if __name__ == "__main__":
+    WatchlistBuilder().publish()
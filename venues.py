@@ -0,0 +1,312 @@
+import time
+import random
+import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from requests.adapters import HTTPAdapter
+from instrumentation import log, RATE_LIMITED, VENUE_ERRORS
+from scan_scheduler import SCAN_CHANGED, SCAN_UNCHANGED, SCAN_ERROR, SCAN_RATE_LIMITED, SCAN_SKIPPED
+
+# Venues the scanner can watch
+# Each venue adapter fetches one product endpoint and normalizes its schema into the product records the scanner
+# already understands (id, quote_currency, post_only, limit_only, cancel_only, status, status_message,
+# trading_disabled, auction_mode). Products are keyed by (venue, symbol), written as "venue/SYMBOL"; the Coinbase
+# Exchange venue keeps bare ids like "BTC-USD", so existing state files, logs and the status stream keep working.
+
+PRIMARY_VENUE = "coinbase"
+
+def product_key(venue, symbol):
+    return symbol if venue == PRIMARY_VENUE else f"{venue}/{symbol}"
+
+def split_key(key):
+    venue, separator, symbol = key.partition('/')
+    return (venue, symbol) if separator else (PRIMARY_VENUE, key)
+
+class VenueAdapter:
+    name = None
+    url = None
+    timeout = 10
+    # Exchange prefix TradingView uses for this venue's symbols
+    tradingview_prefix = "COINBASE"
+    # Payloads that carry prices or server times differ on every request, so an unchanged body hash is rare;
+    # for these the normalized records are compared instead before a scan is treated as changed
+    volatile_payload = True
+
+    def __init__(self, url=None, timeout=None):
+        if url is not None:
+            self.url = url
+        if timeout is not None:
+            self.timeout = timeout
+
+    # Turn the decoded response into a list of product records
+    def normalize(self, payload):
+        raise NotImplementedError
+
+    # Link to the product's trading page, or None when the venue has none
+    def product_url(self, symbol):
+        return None
+
+    def record(self, symbol, quote, status, trading_disabled, post_only=False, limit_only=False, cancel_only=False,
+               auction_mode=False, status_message=''):
+        return {
+            'id': product_key(self.name, symbol),
+            'venue': self.name,
+            'symbol': symbol,
+            'quote_currency': quote,
+            'post_only': bool(post_only),
+            'limit_only': bool(limit_only),
+            'cancel_only': bool(cancel_only),
+            'status': status,
+            'status_message': status_message or '',
+            'trading_disabled': bool(trading_disabled),
+            'auction_mode': bool(auction_mode),
+        }
+
+# Coinbase Exchange /products, the scanner's original source
+# Its records are already in the scanner's format, so they are passed through untouched
+class CoinbaseExchangeAdapter(VenueAdapter):
+    name = PRIMARY_VENUE
+    url = "https://api.pro.coinbase.com/products"
+    volatile_payload = False
+
+    def normalize(self, payload):
+        return payload
+
+    def product_url(self, symbol):
+        return f"https://www.coinbase.com/advanced-trade/spot/{symbol}"
+
+# Coinbase Advanced Trade public market products
+class CoinbaseAdvancedAdapter(VenueAdapter):
+    name = "coinbase-advanced"
+    url = "https://api.coinbase.com/api/v3/brokerage/market/products"
+
+    def normalize(self, payload):
+        return [self.record(product['product_id'], product.get('quote_currency_id', product['product_id'].rsplit('-', 1)[-1]),
+                            str(product.get('status', '')).lower(),
+                            product.get('trading_disabled') or product.get('is_disabled'),
+                            product.get('post_only'), product.get('limit_only'), product.get('cancel_only'),
+                            product.get('auction_mode'))
+                for product in payload.get('products', [])]
+
+    def product_url(self, symbol):
+        return f"https://www.coinbase.com/advanced-trade/spot/{symbol}"
+
+# Coinbase International Exchange instruments
+# Instruments only report a trading state, which becomes the status; anything but TRADING counts as disabled
+class CoinbaseInternationalAdapter(VenueAdapter):
+    name = "coinbase-international"
+    url = "https://api.international.coinbase.com/api/v1/instruments"
+
+    def normalize(self, payload):
+        return [self.record(instrument['symbol'], instrument.get('quote_asset_name', ''),
+                            str(instrument.get('trading_state', '')).lower(),
+                            instrument.get('trading_state') != 'TRADING')
+                for instrument in payload]
+
+# Binance spot exchangeInfo, for the BINANCE: symbols in the watchlist templates
+# Symbols are written BASE-QUOTE like Coinbase ids; anything but TRADING counts as disabled
+class BinanceAdapter(VenueAdapter):
+    name = "binance"
+    url = "https://api.binance.com/api/v3/exchangeInfo"
+    tradingview_prefix = "BINANCE"
+
+    def normalize(self, payload):
+        return [self.record(f"{symbol['baseAsset']}-{symbol['quoteAsset']}", symbol['quoteAsset'],
+                            str(symbol.get('status', '')).lower(), symbol.get('status') != 'TRADING')
+                for symbol in payload.get('symbols', [])]
+
+    def product_url(self, symbol):
+        return f"https://www.binance.com/en/trade/{symbol.replace('-', '_')}"
+
+# Adapters by venue name, as used in the VENUES setting
+ADAPTERS = {adapter.name: adapter for adapter in (CoinbaseExchangeAdapter, CoinbaseAdvancedAdapter, CoinbaseInternationalAdapter, BinanceAdapter)}
+
+def make_adapters(names):
+    try:
+        return [ADAPTERS[name]() for name in names]
+    except KeyError as e:
+        raise ValueError(f"Unknown venue {e}; known venues are {', '.join(ADAPTERS)}") from None
+
+# Per-venue fetch state: a pooled session, the validators and payload hash of the last processed response,
+# and that response's records, which stand in for the venue while it is failing or slow
+# A venue that has not answered yet contributes no products
+class VenueState:
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.headers.update({"Accept": "application/json"})
+        self.etag = None
+        self.modified = None
+        self.payload_hash = None
+        self.records = None
+        # Set by reset(): process the next response even if its records match the last ones
+        self.reprocess = False
+        # A request still running after its timeout; the venue is skipped until it finishes
+        self.future = None
+        # Errors and 429s back off per venue: the venue is skipped until backoff_until (a time.monotonic() value)
+        self.failures = 0
+        self.backoff_until = 0.0
+        self.rate_limited = False
+
+# Result of fetching one venue; state changes are only applied by the fetching thread of the scan that collects it
+class VenueResult:
+    def __init__(self, outcome, records=None, payload_hash=None, etag=None, modified=None, fetch_time=0.0, decode_time=0.0):
+        self.outcome = outcome
+        self.records = records
+        self.payload_hash = payload_hash
+        self.etag = etag
+        self.modified = modified
+        self.fetch_time = fetch_time
+        self.decode_time = decode_time
+
+# Fetches every venue concurrently, each over its own pooled session and with its own timeout,
+# so a slow or failing venue only ever costs its own products, never the others'
+# A venue that errors or answers 429 is skipped for an exponentially growing, jittered delay while the others keep
+# being scanned; the fetch only reports SCAN_ERROR or SCAN_RATE_LIMITED when no venue was scanned successfully,
+# and SCAN_SKIPPED when no venue was requested at all
+class VenueFetcher:
+    def __init__(self, adapters, backoff_base=2.0, max_backoff=60.0):
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.venues = [VenueState(adapter) for adapter in adapters]
+        self.by_name = {venue.adapter.name: venue for venue in self.venues}
+        self.executor = ThreadPoolExecutor(max_workers=len(self.venues), thread_name_prefix="venue-fetch")
+        # Slowest venue's network time and decode time during the last fetch
+        self.fetch_time = 0.0
+        self.decode_time = 0.0
+
+    def fetch_venue(self, venue):
+        # Only send conditional headers once we have fully processed a response carrying them
+        headers = {}
+        if venue.etag:
+            headers["If-None-Match"] = venue.etag
+        if venue.modified:
+            headers["If-Modified-Since"] = venue.modified
+
+        started = time.perf_counter()
+        try:
+            response = venue.session.get(venue.adapter.url, headers=headers, timeout=venue.adapter.timeout)
+            if response.status_code == 429:
+                return VenueResult(SCAN_RATE_LIMITED)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            log(f"Error fetching data from {venue.adapter.name}: {e}", level="error")
+            return VenueResult(SCAN_ERROR)
+
+        # Fast path: the server confirmed nothing changed, or the raw body is byte-for-byte the same as last time
+        # Either way this venue is done before any JSON decoding
+        if response.status_code == 304:
+            payload_hash = venue.payload_hash
+        else:
+            payload_hash = hashlib.blake2b(response.content, digest_size=16).digest()
+        fetch_time = time.perf_counter() - started
+        if venue.payload_hash is not None and payload_hash == venue.payload_hash:
+            return VenueResult(SCAN_UNCHANGED, fetch_time=fetch_time)
+
+        started = time.perf_counter()
+        records = venue.adapter.normalize(response.json())
+        outcome = SCAN_CHANGED
+        if venue.adapter.volatile_payload and not venue.reprocess and records == venue.records:
+            outcome = SCAN_UNCHANGED
+        return VenueResult(outcome, records, payload_hash, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                           fetch_time, time.perf_counter() - started)
+
+    # Fetch every venue and merge the results
+    # Returns the scan outcome and the merged product records, which are None when nothing changed, every venue failed
+    # or every venue was skipped
+    def fetch(self):
+        started = time.monotonic()
+        pending = []
+        for venue in self.venues:
+            if venue.future is not None and not venue.future.done():
+                continue
+            if started < venue.backoff_until:
+                continue
+            venue.future = self.executor.submit(self.fetch_venue, venue)
+            pending.append(venue)
+        if not pending:
+            self.fetch_time = self.decode_time = 0.0
+            return SCAN_SKIPPED, None
+
+        outcomes = []
+        self.fetch_time = self.decode_time = 0.0
+        for venue in pending:
+            try:
+                result = venue.future.result(timeout=max(0.0, started + venue.adapter.timeout - time.monotonic()))
+            except FutureTimeoutError:
+                log(f"{venue.adapter.name} did not respond within {venue.adapter.timeout} s.", level="error")
+                outcomes.append(self.record_outcome(venue, SCAN_ERROR))
+                continue
+            except Exception as e:
+                log(f"Error processing data from {venue.adapter.name}: {e}", level="error")
+                venue.future = None
+                outcomes.append(self.record_outcome(venue, SCAN_ERROR))
+                continue
+            venue.future = None
+            outcomes.append(self.record_outcome(venue, result.outcome))
+            self.fetch_time = max(self.fetch_time, result.fetch_time)
+            self.decode_time = max(self.decode_time, result.decode_time)
+            if result.records is not None:
+                # Remembered up front; reset() forgets it again if processing fails
+                # so the same payload is retried on the next scan instead of being skipped
+                venue.records = result.records
+                venue.reprocess = False
+                venue.payload_hash = result.payload_hash
+                venue.etag = result.etag
+                venue.modified = result.modified
+
+        if SCAN_CHANGED in outcomes:
+            products = []
+            for venue in self.venues:
+                if venue.records is not None:
+                    products.extend(venue.records)
+            return SCAN_CHANGED, products
+        if SCAN_UNCHANGED in outcomes:
+            return SCAN_UNCHANGED, None
+        return (SCAN_RATE_LIMITED if SCAN_RATE_LIMITED in outcomes else SCAN_ERROR), None
+
+    # Count a venue's outcome and start, extend or end its backoff; returns the outcome
+    def record_outcome(self, venue, outcome):
+        if outcome in (SCAN_ERROR, SCAN_RATE_LIMITED):
+            if outcome == SCAN_ERROR:
+                VENUE_ERRORS.inc(venue.adapter.name)
+            else:
+                log(f"Rate limited by {venue.adapter.name}.", level="warning")
+                RATE_LIMITED.inc(venue.adapter.name)
+            venue.failures += 1
+            venue.rate_limited = outcome == SCAN_RATE_LIMITED
+            delay = min(self.max_backoff, self.backoff_base * 2 ** (venue.failures - 1))
+            venue.backoff_until = time.monotonic() + random.uniform(delay / 2, delay)
+        else:
+            venue.failures = 0
+            venue.rate_limited = False
+        return outcome
+
+    # Whether any venue is backing off after a 429; the scanner doesn't start burst polling meanwhile
+    def rate_limited(self):
+        return any(venue.rate_limited for venue in self.venues)
+
+    # Forget every venue's last payload so the next fetch processes them all again
+    # The records are kept so a venue that fails on the retry still contributes its last known products
+    def reset(self):
+        for venue in self.venues:
+            venue.payload_hash = None
+            venue.etag = None
+            venue.modified = None
+            venue.reprocess = True
+
+    def tradingview_prefix(self, venue_name):
+        venue = self.by_name.get(venue_name)
+        return venue.adapter.tradingview_prefix if venue is not None else VenueAdapter.tradingview_prefix
+
+    def product_url(self, key):
+        venue_name, symbol = split_key(key)
+        venue = self.by_name.get(venue_name)
+        return venue.adapter.product_url(symbol) if venue is not None else None
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        for venue in self.venues:
+            venue.session.close()